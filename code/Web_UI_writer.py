@@ -6,7 +6,6 @@ import sys
 import base64
 import tempfile
 from io import BytesIO
-from datetime import datetime
 
 # Определяем корневую директорию проекта
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -16,13 +15,22 @@ CODE_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(CODE_DIR)
 
 from logic_writer import ProfileManager
+import batch_import
 
 # Инициализация eel с путем к web папке в корне проекта
 WEB_DIR = os.path.join(BASE_DIR, 'web')
-eel.init(WEB_DIR)
 
-# Инициализация менеджера профилей
-profile_manager = ProfileManager()
+# Процессы пакетной отрисовки при запуске методом spawn импортируют этот модуль как __mp_main__:
+# в них не нужны ни сервер eel, ни загрузка базы профилей
+if __name__ != "__mp_main__":
+    eel.init(WEB_DIR)
+
+    # Инициализация менеджера профилей
+    try:
+        profile_manager = ProfileManager()
+    except RuntimeError as e:
+        print(f"Ошибка: {e}")
+        sys.exit(1)
 
 @eel.expose
 def get_available_fonts():
@@ -96,30 +104,20 @@ def update_profile(profile_data):
 @eel.expose
 def get_profile_by_id(user_id):
     """Получение профиля по ID"""
-    profile = profile_manager.get_profile_by_id(user_id)
-    if profile:
-        if profile.get('expiration_date'):
-            profile['expiration_date'] = profile_manager.format_date_for_display(
-                profile['expiration_date']
-            )
-        if profile.get('created_at'):
-            try:
-                created_date = datetime.strptime(profile['created_at'], "%Y-%m-%d %H:%M:%S")
-                profile['created_at'] = created_date.strftime("%d.%m.%Y")
-            except:
-                pass
-    return profile
+    return profile_manager.get_display_profile(user_id)
 
 @eel.expose
 def search_profiles(search_term):
     """Поиск профилей"""
     results = profile_manager.search_profiles(search_term)
-    for profile in results:
-        if profile.get('expiration_date'):
-            profile['expiration_date'] = profile_manager.format_date_for_display(
-                profile['expiration_date']
-            )
-    return results
+    return [profile_manager.get_display_profile(profile['ID']) for profile in results]
+
+@eel.expose
+def list_profiles(search_term="", offset=0, limit=50):
+    """Постраничная выдача профилей для таблицы администрирования"""
+    page = profile_manager.get_profiles_page(search_term, offset=offset, limit=limit)
+    page["profiles"] = [profile_manager.get_display_profile(profile['ID']) for profile in page["profiles"]]
+    return page
 
 @eel.expose
 def get_templates():
@@ -246,28 +244,23 @@ def generate_preview(profile_data):
         convert_pattern_to_bw = profile_data.get("convert_pattern_to_bw", False)
         template_name = profile_data.get("template_name")
         
-        preview_image = profile_manager.preview_profile_image(
-            preview_data,
-            convert_pattern_to_bw=convert_pattern_to_bw,
-            template_name=template_name
-        )
-        
+        temp_photo_path = None
         if profile_data.get("photo_base64"):
             photo_data = base64.b64decode(profile_data["photo_base64"].split(',')[1])
             with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as temp_file:
                 temp_file.write(photo_data)
                 temp_photo_path = temp_file.name
-            
-            convert_photo_to_bw = profile_data.get("convert_photo_to_bw", True)
-            
-            preview_image = profile_manager.add_user_photo_to_image(
-                preview_image,
-                temp_photo_path,
-                convert_photo_to_bw=convert_photo_to_bw,
-                convert_pattern_to_bw=convert_pattern_to_bw
+        
+        try:
+            preview_image = profile_manager.preview_profile_image(
+                preview_data,
+                convert_pattern_to_bw=convert_pattern_to_bw,
+                template_name=template_name,
+                photo_path=temp_photo_path,
+                convert_photo_to_bw=profile_data.get("convert_photo_to_bw", True)
             )
-            
-            if os.path.exists(temp_photo_path):
+        finally:
+            if temp_photo_path and os.path.exists(temp_photo_path):
                 os.unlink(temp_photo_path)
         
         buffered = BytesIO()
@@ -280,6 +273,34 @@ def generate_preview(profile_data):
         print(f"Ошибка генерации предпросмотра: {e}")
         return {"error": str(e)}
 
+@eel.expose
+def import_roster(roster_data):
+    """Пакетный выпуск пропусков по списку CSV/XLSX.
+
+    Пути к фото в загруженном списке должны быть абсолютными.
+    """
+    temp_roster_path = None
+    try:
+        roster_bytes = base64.b64decode(roster_data["file_base64"].split(',')[-1])
+        suffix = os.path.splitext(roster_data.get("file_name", ""))[1] or '.csv'
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
+            temp_file.write(roster_bytes)
+            temp_roster_path = temp_file.name
+        
+        return batch_import.import_roster(
+            profile_manager,
+            temp_roster_path,
+            template_name=roster_data.get("template_name"),
+            convert_photo_to_bw=roster_data.get("convert_photo_to_bw", True),
+            convert_pattern_to_bw=roster_data.get("convert_pattern_to_bw", False)
+        )
+    except Exception as e:
+        print(f"Ошибка пакетного выпуска пропусков: {e}")
+        return {"success": False, "error": str(e)}
+    finally:
+        if temp_roster_path and os.path.exists(temp_roster_path):
+            os.unlink(temp_roster_path)
+
 @eel.expose
 def preview_template(template_name):
     """Генерация предпросмотра шаблона"""
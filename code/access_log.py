@@ -0,0 +1,400 @@
+# access_log.py - Конвейер событий доступа: журнал, Excel-отчет и другие приемники
+import datetime
+import json
+import os
+import queue
+import threading
+import time
+import urllib.request
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import PatternFill, Font, Alignment
+
+# Настройки конвейера событий доступа
+EVENT_QUEUE_SIZE = 10000  # Емкость очереди каждого приемника
+EVENT_BATCH_SIZE = 200  # Максимальное число событий в одной пачке
+EVENT_FLUSH_INTERVAL = 1.0  # Как часто рабочий поток проверяет очередь, секунды
+WEBHOOK_TIMEOUT = 3  # Таймаут HTTP-запроса приемника webhook, секунды
+JOURNAL_WAIT_TIMEOUT = 5  # Сколько секунд Excel-отчет ждет дозаписи журнала при смене суток
+
+STATUS_GRANTED = "ДОСТУП РАЗРЕШЕН"
+STATUS_DENIED = "ДОСТУП ЗАПРЕЩЕН"
+
+# Столбцы отчета: (заголовок, поле события, ширина)
+REPORT_COLUMNS = [
+    ('Время', 'time', 20),
+    ('ID', 'ID', 15),
+    ('ФИО', 'full_name', 30),
+    ('Организация', 'organization', 40),
+    ('Отдел', 'department', 30),
+    ('Срок действия', 'expiration_date', 15),
+    ('Статус доступа', 'status', 20),
+    ('Причина', 'reason', 30),
+    ('Проход', 'lane', 15),
+]
+
+GRANTED_FILL = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")  # Светло-зеленый
+DENIED_FILL = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")  # Светло-красный
+
+
+def journal_path(log_dir, date):
+    """Путь к журналу событий за день (JSON Lines)"""
+    return os.path.join(log_dir, f"log_{date}.jsonl")
+
+
+def report_path(log_dir, date):
+    """Путь к Excel-отчету за день"""
+    return os.path.join(log_dir, f"log_{date}.xlsx")
+
+
+def make_access_event(user_data, access_granted, reason="", lane=None):
+    """Формирует событие доступа для журнала"""
+    event = {
+        'time': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'granted': bool(access_granted),
+        'status': STATUS_GRANTED if access_granted else STATUS_DENIED,
+        'reason': reason,
+    }
+    if lane is not None:
+        event['lane'] = str(lane)
+    for field in ('ID', 'full_name', 'organization', 'department', 'expiration_date'):
+        value = user_data.get(field, 'Неизвестно') if user_data else 'Неизвестно'
+        if isinstance(value, datetime.date):
+            value = value.strftime('%Y-%m-%d')
+        event[field] = value if value is None else str(value)
+    return event
+
+
+def read_journal(path):
+    """Читает события из журнала, пропуская поврежденные строки"""
+    events = []
+    if not os.path.exists(path):
+        return events
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                events.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue  # Строка, оборванная при аварийном завершении
+    return events
+
+
+def import_excel_log(xlsx_file, journal_file):
+    """Переносит строки старого Excel-лога в журнал (однократно при переходе на журнал)"""
+    workbook = load_workbook(xlsx_file, read_only=True)
+    worksheet = workbook.active
+    fields = [field for _, field, _ in REPORT_COLUMNS]
+    with open(journal_file, "a", encoding="utf-8") as f:
+        for row in worksheet.iter_rows(min_row=2, values_only=True):
+            if not row or row[0] is None:
+                continue
+            event = {field: ('' if value is None else str(value)) for field, value in zip(fields, row)}
+            event['granted'] = event.get('status') == STATUS_GRANTED
+            f.write(json.dumps(event, ensure_ascii=False) + "\n")
+    workbook.close()
+
+
+def import_legacy_log(log_dir, date):
+    """Переносит Excel-лог за день в журнал, если журнала за этот день еще нет"""
+    journal_file = journal_path(log_dir, date)
+    xlsx_file = report_path(log_dir, date)
+    if os.path.exists(journal_file) or not os.path.exists(xlsx_file):
+        return
+    try:
+        import_excel_log(xlsx_file, journal_file)
+    except Exception as e:
+        print(f"Не удалось перенести старый лог {xlsx_file}: {e}")
+
+
+def build_excel_report(journal_file, xlsx_file):
+    """Строит цветной Excel-отчет по журналу событий"""
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.title = "Лог доступа"
+
+    for col, (header, _, width) in enumerate(REPORT_COLUMNS, 1):
+        cell = worksheet.cell(row=1, column=col, value=header)
+        cell.font = Font(bold=True)
+        cell.alignment = Alignment(horizontal='center')
+        worksheet.column_dimensions[cell.column_letter].width = width
+
+    for row, event in enumerate(read_journal(journal_file), 2):
+        fill = GRANTED_FILL if event.get('granted') else DENIED_FILL
+        for col, (_, field, _) in enumerate(REPORT_COLUMNS, 1):
+            cell = worksheet.cell(row=row, column=col, value=event.get(field, ''))
+            cell.fill = fill
+
+    workbook.save(xlsx_file)
+    return xlsx_file
+
+
+def outdated_report_dates(log_dir):
+    """Дни, для которых Excel-отчета нет или он старше журнала (например, после аварийного завершения)"""
+    dates = set()
+    if not os.path.isdir(log_dir):
+        return dates
+    for name in os.listdir(log_dir):
+        if not (name.startswith("log_") and name.endswith(".jsonl")):
+            continue
+        date = name[len("log_"):-len(".jsonl")]
+        xlsx_file = report_path(log_dir, date)
+        if not os.path.exists(xlsx_file) or os.path.getmtime(xlsx_file) < os.path.getmtime(journal_path(log_dir, date)):
+            dates.add(date)
+    return dates
+
+
+def export_report(log_dir, date=None):
+    """Строит Excel-отчет за указанный день (по умолчанию за сегодня)"""
+    date = date or datetime.datetime.now().strftime("%Y-%m-%d")
+    return build_excel_report(journal_path(log_dir, date), report_path(log_dir, date))
+
+
+class AccessSink:
+    """Базовый приемник событий доступа"""
+
+    name = "sink"
+
+    def handle_batch(self, events):
+        """Обрабатывает пачку событий"""
+        raise NotImplementedError
+
+    def tick(self):
+        """Вызывается рабочим потоком, когда очередь пуста"""
+
+    def close(self):
+        """Завершает работу приемника"""
+
+
+class ConsoleSink(AccessSink):
+    """Вывод решений о доступе в консоль"""
+
+    name = "console"
+
+    def handle_batch(self, events):
+        for event in events:
+            prefix = f"[{event['lane']}] " if event.get('lane') else ""
+            if event.get('granted'):
+                print(f"{prefix}✓ ДОСТУП РАЗРЕШЕН - {event.get('full_name', 'Unknown')}")
+            else:
+                print(f"{prefix}✗ ДОСТУП ЗАПРЕЩЕН - {event.get('reason', '')}")
+
+
+class JournalSink(AccessSink):
+    """Дозапись событий в журнал JSON Lines с одним fsync на пачку"""
+
+    name = "journal"
+
+    def __init__(self, log_dir):
+        self.log_dir = log_dir
+        self.current_date = None
+        self.file = None
+        self.written = 0  # Сколько событий записано на диск
+        self.written_condition = threading.Condition()
+
+    def handle_batch(self, events):
+        for event in events:
+            date = event['time'][:10]
+            if date != self.current_date:
+                self.open_day(date)
+            self.file.write(json.dumps(event, ensure_ascii=False) + "\n")
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        with self.written_condition:
+            self.written += len(events)
+            self.written_condition.notify_all()
+
+    def wait_written(self, count, timeout=JOURNAL_WAIT_TIMEOUT):
+        """Ждет, пока на диск будет записано не меньше count событий; False по таймауту"""
+        with self.written_condition:
+            return self.written_condition.wait_for(lambda: self.written >= count, timeout)
+
+    def open_day(self, date):
+        """Закрывает журнал предыдущего дня и открывает журнал за date"""
+        self.close()
+        self.current_date = date
+        os.makedirs(self.log_dir, exist_ok=True)
+        import_legacy_log(self.log_dir, date)
+        self.file = open(journal_path(self.log_dir, date), "a", encoding="utf-8")
+
+    def close(self):
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            self.file = None
+
+
+class XlsxSink(AccessSink):
+    """Цветной Excel-отчет за день, который строится из журнала при смене суток и при остановке.
+
+    Пока идут проходы, отчет не перестраивается: за текущий день его
+    строит reader.py --report. Отчеты, не построенные из-за аварийного
+    завершения, строятся после запуска.
+    """
+
+    name = "xlsx"
+
+    def __init__(self, log_dir, journal=None):
+        self.log_dir = log_dir
+        self.journal = journal  # JournalSink, чей журнал читается при построении отчета
+        self.seen = 0  # Сколько событий получено; журнал получает те же события
+        self.dirty_dates = outdated_report_dates(log_dir)
+
+    def handle_batch(self, events):
+        self.seen += len(events)
+        self.dirty_dates.update(event['time'][:10] for event in events)
+
+    def tick(self):
+        today = datetime.datetime.now().strftime("%Y-%m-%d")
+        finished = {date for date in self.dirty_dates if date < today}
+        if finished:
+            # Журнал пишет свой поток со своей очередью: ждем, пока он запишет все уже полученные события
+            if self.journal is not None and not self.journal.wait_written(self.seen):
+                print("Журнал доступа не дописан за отведенное время, Excel-отчет строится по записанной части")
+            self.save(finished)
+
+    def save(self, dates):
+        for date in sorted(dates):
+            # Без журнала отчет был бы пустым и затер бы существующий файл
+            if os.path.exists(journal_path(self.log_dir, date)):
+                export_report(self.log_dir, date)
+        self.dirty_dates -= dates
+
+    def close(self):
+        self.save(set(self.dirty_dates))
+
+
+class WebhookSink(AccessSink):
+    """Отправка событий POST-запросом в формате JSON (например, в локальную СКУД)"""
+
+    name = "webhook"
+
+    def __init__(self, url, timeout=WEBHOOK_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+
+    def handle_batch(self, events):
+        data = json.dumps(events, ensure_ascii=False).encode("utf-8")
+        request = urllib.request.Request(self.url, data=data, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class SinkWorker:
+    """Рабочий поток приемника с собственной ограниченной очередью и счетчиками"""
+
+    def __init__(self, sink, queue_size, batch_size, flush_interval):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.last_latency = 0.0  # Задержка от события до обработки, секунды
+        self.thread = threading.Thread(target=self.run, name=f"access-{sink.name}", daemon=True)
+        self.thread.start()
+
+    def offer(self, event):
+        """Ставит событие в очередь без ожидания; при переполнении событие отбрасывается"""
+        try:
+            self.queue.put_nowait((time.monotonic(), event))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+        return True
+
+    def stop(self):
+        """Дописывает очередь и останавливает поток"""
+        self.queue.put((time.monotonic(), None))
+        self.thread.join()
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                self.call(self.sink.tick)
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            events = [event for _, event in batch if event is not None]
+            stopping = len(events) != len(batch)
+            if events and self.call(self.sink.handle_batch, events):
+                self.processed += len(events)
+                self.last_latency = time.monotonic() - batch[0][0]
+        self.call(self.sink.close)
+
+    def call(self, method, *args):
+        """Вызывает метод приемника, не давая ошибке остановить поток"""
+        try:
+            method(*args)
+            return True
+        except Exception as e:
+            self.errors += 1
+            print(f"Ошибка приемника событий '{self.sink.name}': {e}")
+            return False
+
+    def metrics(self):
+        return {
+            'depth': self.queue.qsize(),
+            'max_depth': self.max_depth,
+            'enqueued': self.enqueued,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'last_latency_ms': round(self.last_latency * 1000, 1),
+        }
+
+
+class AccessEventPipeline:
+    """Асинхронная доставка событий доступа в приемники.
+
+    submit() не блокирует цикл камеры: событие раскладывается по ограниченным
+    очередям приемников, каждую из которых разбирает свой поток. Медленный
+    приемник (например, webhook) не задерживает остальные, а при переполнении
+    его очереди события для него отбрасываются и учитываются в метриках.
+    """
+
+    def __init__(self, sinks, queue_size=EVENT_QUEUE_SIZE, batch_size=EVENT_BATCH_SIZE,
+                 flush_interval=EVENT_FLUSH_INTERVAL):
+        self.workers = [SinkWorker(sink, queue_size, batch_size, flush_interval) for sink in sinks]
+
+    def submit(self, event):
+        """Передает событие всем приемникам; возвращает False, если хотя бы один его отбросил"""
+        accepted = True
+        for worker in self.workers:
+            accepted = worker.offer(event) and accepted
+        return accepted
+
+    def metrics(self):
+        """Метрики очередей по приемникам"""
+        return {worker.sink.name: worker.metrics() for worker in self.workers}
+
+    def close(self):
+        """Дописывает все очереди и закрывает приемники"""
+        for worker in self.workers:
+            worker.stop()
+
+
+def create_default_pipeline(log_dir, webhook_url=None):
+    """Конвейер с приемниками по умолчанию: консоль, журнал, Excel и (опционально) webhook"""
+    # Старый Excel-лог за сегодня переносится до запуска потоков, чтобы XlsxSink его не затер
+    os.makedirs(log_dir, exist_ok=True)
+    import_legacy_log(log_dir, datetime.datetime.now().strftime("%Y-%m-%d"))
+    journal = JournalSink(log_dir)
+    sinks = [ConsoleSink(), journal, XlsxSink(log_dir, journal)]
+    if webhook_url:
+        sinks.append(WebhookSink(webhook_url))
+    return AccessEventPipeline(sinks)
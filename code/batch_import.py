@@ -0,0 +1,244 @@
+# batch_import.py - Пакетный выпуск пропусков по списку из CSV/XLSX
+import argparse
+import csv
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from openpyxl import load_workbook
+from logic_writer import ProfileManager
+
+BATCH_WORKERS = None  # Число процессов отрисовки; None - по числу ядер
+BATCH_MIN_PARALLEL_ROWS = 8  # Меньшие списки рисуются в текущем процессе без запуска пула
+CSV_DELIMITERS = ",;\t"
+# Кодировки CSV: UTF-8 и кодировка Excel в русской Windows ("CSV (разделители - запятые)")
+CSV_ENCODINGS = ("utf-8-sig", "cp1251")
+
+# Допустимые заголовки столбцов списка (без учета регистра)
+ROSTER_COLUMNS = {
+    'full_name': ('фио', 'full_name'),
+    'organization': ('организация', 'organization'),
+    'department': ('отдел', 'department'),
+    'expiration_date': ('срок действия', 'действителен до', 'expiration_date'),
+    'photo': ('фото', 'photo'),
+}
+
+worker_manager = None  # ProfileManager без профилей в процессе отрисовки
+
+
+def map_header(header):
+    """Сопоставляет заголовки столбцов с полями профиля: {номер столбца: поле}"""
+    columns = {}
+    for index, title in enumerate(header):
+        title = str(title or '').strip().casefold()
+        for field, names in ROSTER_COLUMNS.items():
+            if title in names:
+                columns[index] = field
+    return columns
+
+
+def cell_to_text(value):
+    """Приводит значение ячейки к строке; даты Excel - к ДД.ММ.ГГГГ"""
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.strftime("%d.%m.%Y")
+    return str(value).strip()
+
+
+def read_csv_text(path):
+    """Читает CSV, пробуя кодировки CSV_ENCODINGS по порядку"""
+    with open(path, "rb") as f:
+        raw = f.read()
+    for encoding in CSV_ENCODINGS[:-1]:
+        try:
+            return raw.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return raw.decode(CSV_ENCODINGS[-1])
+
+
+def read_roster(path):
+    """Читает список из CSV или XLSX; возвращает строки-словари с номером строки файла в поле 'row'"""
+    if path.lower().endswith(('.xlsx', '.xlsm')):
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        rows = list(workbook.active.iter_rows(values_only=True))
+        workbook.close()
+    else:
+        text = read_csv_text(path)
+        try:
+            dialect = csv.Sniffer().sniff(text[:4096], delimiters=CSV_DELIMITERS)
+        except csv.Error:
+            dialect = csv.excel
+        rows = list(csv.reader(io.StringIO(text, newline=''), dialect))
+
+    if not rows:
+        return []
+    columns = map_header(rows[0])
+    if 'full_name' not in columns.values():
+        raise ValueError("В первой строке списка нет столбца «ФИО»")
+
+    roster = []
+    for row_number, row in enumerate(rows[1:], 2):
+        entry = {field: cell_to_text(row[index]) if index < len(row) else "" for index, field in columns.items()}
+        if any(entry.values()):
+            entry['row'] = row_number
+            roster.append(entry)
+    return roster
+
+
+def init_worker(template):
+    """Инициализация процесса отрисовки: менеджер без загрузки базы и текущий шаблон"""
+    global worker_manager
+    worker_manager = ProfileManager(load_profiles=False)
+    worker_manager.set_current_template(template)
+
+
+def render_badge(task, manager=None):
+    """Рисует пропуск; возвращает (ID, имя файла, ошибка)"""
+    data, photo_path, convert_photo_to_bw, convert_pattern_to_bw = task
+    manager = manager or worker_manager
+    try:
+        filename = manager.create_profile_image(data, convert_pattern_to_bw=convert_pattern_to_bw,
+                                                photo_path=photo_path, convert_photo_to_bw=convert_photo_to_bw)
+        return data['ID'], filename, None
+    except Exception as e:
+        return data['ID'], None, str(e)
+
+
+def import_roster(manager, roster_path, template_name=None, convert_photo_to_bw=True, convert_pattern_to_bw=False,
+                  workers=BATCH_WORKERS):
+    """Выпускает пропуска по списку: ID выдаются за один проход, пропуска рисуются параллельно,
+    профили успешно нарисованных пропусков сохраняются в базу одной операцией.
+
+    Пути к фото в списке указываются абсолютными или относительно папки списка.
+    Возвращает отчет с результатом по каждой строке и общей скоростью.
+    """
+    start_time = time.perf_counter()
+    roster = read_roster(roster_path)
+    roster_dir = os.path.dirname(os.path.abspath(roster_path))
+
+    template = manager.current_template
+    if template_name and template_name != "default":
+        template = manager.load_template(template_name) or template
+
+    # Проверка строк и выдача ID
+    results = []
+    tasks = []
+    allocated = set()
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for entry in roster:
+        result = {"row": entry['row'], "full_name": entry.get('full_name', ""), "success": False}
+        results.append(result)
+        if not entry.get('full_name'):
+            result["error"] = "Поле ФИО обязательно для заполнения!"
+            continue
+
+        expiration_storage = None
+        if entry.get('expiration_date'):
+            if not manager.validate_date(entry['expiration_date']):
+                result["error"] = "Неверный формат даты! Используйте ДД.ММ.ГГГГ"
+                continue
+            expiration_storage = manager.format_date_for_storage(entry['expiration_date'])
+
+        photo_path = None
+        if entry.get('photo'):
+            photo_path = os.path.join(roster_dir, entry['photo'])
+            if not os.path.exists(photo_path):
+                result["error"] = f"Фото не найдено: {entry['photo']}"
+                continue
+
+        user_id = manager.generate_unique_id()
+        while user_id in allocated:
+            user_id = manager.generate_unique_id()
+        allocated.add(user_id)
+
+        data = {
+            "ID": user_id,
+            "full_name": entry['full_name'],
+            "organization": entry.get('organization', ""),
+            "department": entry.get('department', ""),
+            "created_at": now,
+            "updated_at": now
+        }
+        if expiration_storage:
+            data["expiration_date"] = expiration_storage
+            data["is_temporary"] = True
+
+        result["user_id"] = user_id
+        tasks.append((data, photo_path, convert_photo_to_bw, convert_pattern_to_bw))
+
+    # Отрисовка: пул процессов для больших списков, текущий процесс - для маленьких
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(tasks) >= BATCH_MIN_PARALLEL_ROWS:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(template,)) as executor:
+            rendered = list(executor.map(render_badge, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+    else:
+        old_template = manager.current_template
+        manager.current_template = template
+        try:
+            rendered = [render_badge(task, manager) for task in tasks]
+        finally:
+            manager.current_template = old_template
+
+    # Сохранение в базу одной операцией
+    results_by_id = {result["user_id"]: result for result in results if "user_id" in result}
+    created = []
+    for (data, _, _, _), (user_id, filename, error) in zip(tasks, rendered):
+        result = results_by_id[user_id]
+        if error:
+            result["error"] = error
+            continue
+        result["success"] = True
+        result["filename"] = filename
+        created.append(data)
+    if created:
+        manager.save_profiles(created)
+
+    elapsed = time.perf_counter() - start_time
+    return {
+        "success": True,
+        "results": results,
+        "total": len(results),
+        "created": len(created),
+        "failed": len(results) - len(created),
+        "elapsed": round(elapsed, 2),
+        "badges_per_second": round(len(created) / elapsed, 1) if elapsed > 0 else None,
+    }
+
+
+def print_report(report):
+    """Вывод отчета о пакетном выпуске в консоль"""
+    for result in report["results"]:
+        if result["success"]:
+            print(f"  строка {result['row']}: {result['user_id']} {result['full_name']} -> {result['filename']}")
+        else:
+            print(f"  строка {result['row']}: ОШИБКА {result['full_name']}: {result['error']}")
+    print(f"Выпущено {report['created']} из {report['total']} за {report['elapsed']} с "
+          f"({report['badges_per_second']} пропусков/с), ошибок: {report['failed']}")
+
+
+def parse_args():
+    """Разбор аргументов командной строки"""
+    parser = argparse.ArgumentParser(description="u.p.i.c - пакетный выпуск пропусков по списку")
+    parser.add_argument("roster", help="CSV или XLSX со столбцами ФИО, Организация, Отдел, Срок действия, Фото")
+    parser.add_argument("--template", help="имя стиля из templates.json")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="число процессов отрисовки")
+    parser.add_argument("--color-photo", action="store_true", help="не переводить фото в черно-белое")
+    parser.add_argument("--bw-pattern", action="store_true", help="переводить фон в черно-белое")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        manager = ProfileManager()
+    except RuntimeError as e:
+        print(f"Ошибка: {e}")
+        sys.exit(1)
+    report = import_roster(manager, args.roster, template_name=args.template,
+                           convert_photo_to_bw=not args.color_photo, convert_pattern_to_bw=args.bw_pattern,
+                           workers=args.workers)
+    print_report(report)
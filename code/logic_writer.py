@@ -2,20 +2,48 @@
 import random
 import string
 import json
-import qrcode
 from PIL import Image, ImageDraw, ImageFont, ImageOps
 import os
 from datetime import datetime, timedelta
 import textwrap
+import hashlib
+from io import BytesIO
+from profile_store import open_profile_store, lock_profile_writer
+from search_index import ProfileSearchIndex
+from qr_signing import SIGNED_QR_ENABLED, load_signing_key, sign_payload
+from render_cache import (get_font, load_cached_image, prepare_pattern, prepare_timer, layer_cache,
+                          render_qr_image)
+
+TEXT_LAYER_PADDING = 10  # Запас вокруг текстового блока для выступающих элементов глифов
 
 class ProfileManager:
-    def __init__(self):
+    def __init__(self, load_profiles=True):
         # Определяем базовую директорию проекта
         self.base_dir = self.get_base_directory()
-        self.existing_data = self.load_existing_data()
+        # Без профилей (load_profiles=False) менеджер только рисует пропуска - так работают процессы пакетной отрисовки
+        self.writer_lock = lock_profile_writer(self.get_full_path("database")) if load_profiles else None
+        if load_profiles and self.writer_lock is None:
+            raise RuntimeError("База профилей уже открыта другой программой (генератор пропусков или batch_import.py). "
+                               "Закройте ее и повторите запуск")
+        self.store = open_profile_store(self.get_full_path("database")) if load_profiles else None
+        # Ключ подписи данных QR-кода (если подписанные QR-коды включены)
+        self.signing_key = load_signing_key(self.get_full_path("database"), create=True) if SIGNED_QR_ENABLED else None
+        # Индекс ID → запись профиля; порядок вставки совпадает с порядком в базе
+        self.profiles = {user['ID']: user for user in self.load_existing_data()} if load_profiles else {}
+        self.search_index = ProfileSearchIndex()
+        self.search_index.add_many(self.profiles.values())
+        # Версии записей и кэш проекций для отображения (ID -> (версия, проекция))
+        self.profile_versions = {}
+        self.display_cache = {}
         self.templates = self.load_templates()
         self.current_template = self.get_default_template()
-        self.check_expired_ids()
+        if load_profiles:
+            self.check_expired_ids()
+    
+    @property
+    def existing_data(self):
+        """Список всех профилей (порядок как в базе)"""
+        return list(self.profiles.values())
     
     def get_base_directory(self):
         """Возвращает базовую директорию проекта"""
@@ -74,8 +102,7 @@ class ProfileManager:
             return font_path_in_root
         
         try:
-            from PIL import ImageFont
-            test_font = ImageFont.truetype(font_name, 12)
+            get_font(font_name, 12)
             return font_name
         except:
             default_font = self.get_full_path("font/Cormorant-Bold.ttf")
@@ -102,38 +129,14 @@ class ProfileManager:
         return default_pattern
     
     def load_existing_data(self):
-        """Загружает существующие данные из database/data_user.md"""
-        data_file = self.get_full_path("database/data_user.md")
-        if os.path.exists(data_file):
-            try:
-                with open(data_file, "r", encoding="utf-8") as f:
-                    content = f.read().strip()
-                    if not content:
-                        return []
-                    
-                    users = []
-                    user_blocks = content.split('---')
-                    
-                    for block in user_blocks:
-                        block = block.strip()
-                        if not block:
-                            continue
-                            
-                        user_data = {}
-                        lines = block.split('\n')
-                        for line in lines:
-                            if ':' in line:
-                                key, value = line.split(':', 1)
-                                user_data[key.strip()] = value.strip()
-                        
-                        if user_data:
-                            users.append(user_data)
-                    
-                    return users
-            except Exception as e:
-                print(f"Ошибка при загрузке данных: {e}")
-                return []
-        return []
+        """Загружает существующие профили из хранилища (database/)"""
+        try:
+            users = self.store.load()
+            self.store.maybe_compact()
+            return users
+        except Exception as e:
+            print(f"Ошибка при загрузке данных: {e}")
+            return []
     
     def reload_templates(self):
         """Перезагружает шаблоны из файла"""
@@ -175,32 +178,46 @@ class ProfileManager:
         }
     
     def save_all_data(self):
-        """Сохраняет все данные в database/data_user.md"""
-        data_file = self.get_full_path("database/data_user.md")
-        os.makedirs(os.path.dirname(data_file), exist_ok=True)
-        
-        content = ""
-        for user in self.existing_data:
-            content += "---\n"
-            for key, value in user.items():
-                content += f"{key}: {value}\n"
-            content += "\n"
-        
-        with open(data_file, "w", encoding="utf-8") as f:
-            f.write(content)
+        """Полностью перезаписывает хранилище профилей"""
+        self.store.rewrite(self.existing_data)
+    
+    def save_profile(self, user):
+        """Дописывает созданный или измененный профиль в журнал и обновляет поисковый индекс"""
+        self.store.put(user)
+        self.search_index.add(user)
+        self.profile_versions[user['ID']] = self.profile_versions.get(user['ID'], 0) + 1
+    
+    def save_profiles(self, users):
+        """Дописывает пачку новых профилей в хранилище одной операцией и индексирует их"""
+        for user in users:
+            self.profiles[user['ID']] = user
+        self.store.put_many(users)
+        for user in users:
+            self.search_index.add(user)
+            self.profile_versions[user['ID']] = self.profile_versions.get(user['ID'], 0) + 1
+    
+    def remove_profile_record(self, user_id):
+        """Удаляет профиль из памяти, индексов и журнала; возвращает удаленную запись"""
+        user = self.profiles.pop(user_id, None)
+        if user is not None:
+            self.search_index.remove(user_id)
+            self.profile_versions.pop(user_id, None)
+            self.display_cache.pop(user_id, None)
+            self.store.delete(user_id)
+        return user
     
     def check_expired_ids(self):
         """Проверяет и удаляет просроченные ID"""
         current_date = datetime.now().strftime("%Y-%m-%d")
         expired_profiles = []
         
-        for user in self.existing_data:
-            if isinstance(user, dict) and user.get('expiration_date'):
+        for user in self.profiles.values():
+            if user.get('expiration_date'):
                 if user['expiration_date'] < current_date:
                     expired_profiles.append(user)
         
         for expired_user in expired_profiles:
-            self.existing_data.remove(expired_user)
+            self.remove_profile_record(expired_user['ID'])
             
             safe_name = "".join(c if c.isalnum() or c in " _-" else "_" for c in expired_user.get('full_name', ''))
             filename = os.path.join(self.get_output_dir(), f"{safe_name}_{expired_user.get('ID', '')}_profile.bmp")
@@ -211,17 +228,15 @@ class ProfileManager:
                     print(f"Не удалось удалить файл {filename}: {e}")
         
         if expired_profiles:
-            self.save_all_data()
             print(f"Удалено {len(expired_profiles)} просроченных профилей")
     
     def generate_unique_id(self):
         """Генерирует уникальный ID, которого еще нет в системе"""
         characters = string.ascii_uppercase + string.digits
-        existing_ids = [user.get('ID', '') for user in self.existing_data if isinstance(user, dict)]
         
         while True:
             new_id = ''.join(random.choice(characters) for _ in range(8))
-            if new_id not in existing_ids:
+            if new_id not in self.profiles:
                 return new_id
     
     def validate_date(self, date_string):
@@ -280,13 +295,11 @@ class ProfileManager:
             data["expiration_date"] = expiration_storage
             data["is_temporary"] = True
         
-        self.existing_data.append(data)
-        self.save_all_data()
-        
-        filename = self.create_profile_image(data, convert_pattern_to_bw=convert_pattern_to_bw)
+        self.profiles[user_id] = data
+        self.save_profile(data)
         
-        if photo_path:
-            self.add_user_photo(filename, photo_path, convert_photo_to_bw=convert_photo_to_bw, convert_pattern_to_bw=convert_pattern_to_bw)
+        filename = self.create_profile_image(data, convert_pattern_to_bw=convert_pattern_to_bw,
+                                             photo_path=photo_path, convert_photo_to_bw=convert_photo_to_bw)
         
         if template_name and template_name != "default":
             self.current_template = old_template
@@ -315,30 +328,25 @@ class ProfileManager:
                 raise ValueError("Неверный формат даты! Используйте ДД.ММ.ГГГГ")
             expiration_storage = self.format_date_for_storage(expiration_date)
         
-        for user in self.existing_data:
-            if user.get('ID') == user_id:
-                user['full_name'] = full_name
-                user['organization'] = organization
-                user['department'] = department
-                user['updated_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                
-                if expiration_storage:
-                    user['expiration_date'] = expiration_storage
-                    user['is_temporary'] = True
-                elif 'expiration_date' in user:
-                    del user['expiration_date']
-                    if 'is_temporary' in user:
-                        del user['is_temporary']
-                break
-        
-        self.save_all_data()
-        
-        updated_user = next((user for user in self.existing_data if user.get('ID') == user_id), None)
+        updated_user = self.profiles.get(user_id)
         if updated_user:
-            filename = self.create_profile_image(updated_user, update_mode=True, convert_pattern_to_bw=convert_pattern_to_bw)
+            updated_user['full_name'] = full_name
+            updated_user['organization'] = organization
+            updated_user['department'] = department
+            updated_user['updated_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            
+            if expiration_storage:
+                updated_user['expiration_date'] = expiration_storage
+                updated_user['is_temporary'] = True
+            elif 'expiration_date' in updated_user:
+                del updated_user['expiration_date']
+                if 'is_temporary' in updated_user:
+                    del updated_user['is_temporary']
+            
+            self.save_profile(updated_user)
             
-            if photo_path:
-                self.add_user_photo(filename, photo_path, convert_photo_to_bw=convert_photo_to_bw, convert_pattern_to_bw=convert_pattern_to_bw)
+            filename = self.create_profile_image(updated_user, update_mode=True, convert_pattern_to_bw=convert_pattern_to_bw,
+                                                 photo_path=photo_path, convert_photo_to_bw=convert_photo_to_bw)
             
             if template_name and template_name != "default":
                 self.current_template = old_template
@@ -352,13 +360,10 @@ class ProfileManager:
     
     def delete_profile(self, user_id):
         """Удаляет профиль"""
-        user_to_delete = next((user for user in self.existing_data if user.get('ID') == user_id), None)
+        user_to_delete = self.remove_profile_record(user_id)
         if not user_to_delete:
             return {"success": False, "error": "Профиль не найден"}
         
-        self.existing_data = [user for user in self.existing_data if user.get('ID') != user_id]
-        self.save_all_data()
-        
         safe_name = "".join(c if c.isalnum() or c in " _-" else "_" for c in user_to_delete.get('full_name', ''))
         filename = os.path.join(self.get_output_dir(), f"{safe_name}_{user_id}_profile.bmp")
         if os.path.exists(filename):
@@ -369,28 +374,51 @@ class ProfileManager:
         
         return {"success": True}
     
-    def search_profiles(self, search_term):
-        """Ищет профили по ID или ФИО"""
-        results = []
-        
-        if not search_term.strip():
-            return self.existing_data
-        
-        for user in self.existing_data:
-            if isinstance(user, dict):
-                if user.get('ID', '').upper() == search_term.upper():
-                    results.append(user)
-                elif search_term.lower() in user.get('full_name', '').lower():
-                    results.append(user)
-        
-        return results
+    def search_profiles(self, search_term, offset=0, limit=None):
+        """Ищет профили по началу слов в ID, ФИО, организации и отделе (по релевантности)"""
+        user_ids, _ = self.search_index.search(search_term, offset=offset, limit=limit)
+        return [self.profiles[user_id] for user_id in user_ids]
+    
+    def get_profiles_page(self, search_term, offset=0, limit=50):
+        """Возвращает страницу результатов поиска и общее число найденных профилей"""
+        user_ids, total = self.search_index.search(search_term, offset=offset, limit=limit)
+        return {
+            "profiles": [self.profiles[user_id] for user_id in user_ids],
+            "total": total,
+            "offset": offset
+        }
     
     def get_profile_by_id(self, user_id):
         """Возвращает профиль по ID"""
-        for user in self.existing_data:
-            if user.get('ID') == user_id:
-                return user
-        return None
+        return self.profiles.get(user_id)
+    
+    def get_display_profile(self, user_id):
+        """Возвращает профиль с датами в формате для отображения.
+
+        Проекция кэшируется до следующего изменения записи и используется
+        только для чтения: хранимые данные при этом не меняются.
+        """
+        user = self.profiles.get(user_id)
+        if user is None:
+            return None
+        
+        version = self.profile_versions.get(user_id, 0)
+        cached = self.display_cache.get(user_id)
+        if cached and cached[0] == version:
+            return cached[1]
+        
+        projection = dict(user)
+        if projection.get('expiration_date'):
+            projection['expiration_date'] = self.format_date_for_display(projection['expiration_date'])
+        if projection.get('created_at'):
+            try:
+                created_date = datetime.strptime(projection['created_at'], "%Y-%m-%d %H:%M:%S")
+                projection['created_at'] = created_date.strftime("%d.%m.%Y")
+            except ValueError:
+                pass
+        
+        self.display_cache[user_id] = (version, projection)
+        return projection
     
     def recover_profile(self, user_id, photo_path=None, convert_photo_to_bw=True, convert_pattern_to_bw=False, template_name=None):
         """Восстанавливает профиль (создает изображение заново)"""
@@ -404,10 +432,8 @@ class ProfileManager:
                 old_template = self.current_template
                 self.current_template = template
         
-        filename = self.create_profile_image(user_data, recover_mode=True, convert_pattern_to_bw=convert_pattern_to_bw)
-        
-        if photo_path:
-            self.add_user_photo(filename, photo_path, convert_photo_to_bw=convert_photo_to_bw, convert_pattern_to_bw=convert_pattern_to_bw)
+        filename = self.create_profile_image(user_data, recover_mode=True, convert_pattern_to_bw=convert_pattern_to_bw,
+                                             photo_path=photo_path, convert_photo_to_bw=convert_photo_to_bw)
         
         if template_name and template_name != "default":
             self.current_template = old_template
@@ -417,6 +443,17 @@ class ProfileManager:
             "filename": filename
         }
     
+    def get_qr_payload(self, data, preview_mode=False):
+        """Возвращает данные для QR-кода: ID или подписанные ID, срок действия и признак временного пропуска.
+
+        Предпросмотр не подписывается: иначе снимок экрана с предпросмотром
+        работал бы как настоящий пропуск.
+        """
+        if self.signing_key is None or preview_mode:
+            return data['ID']
+        return sign_payload(self.signing_key, data['ID'], data.get('expiration_date'),
+                            bool(data.get('is_temporary', False)))
+    
     def wrap_text(self, text, max_chars_per_line):
         """Разбивает текст на несколько строк с увеличенным переносом"""
         adjusted_max_chars = max_chars_per_line - 5
@@ -427,8 +464,82 @@ class ProfileManager:
         wrapped_lines = textwrap.wrap(text, width=adjusted_max_chars)
         return wrapped_lines
     
-    def create_profile_image(self, data, recover_mode=False, update_mode=False, preview_mode=False, convert_pattern_to_bw=False):
-        """Создает изображение профиля на основе данных"""
+    def get_text_layer(self, header, text, max_chars_per_line, line_step, header_font, data_font):
+        """Возвращает маску блока «заголовок и значение» и высоту, на которую блок сдвигает следующий.
+
+        Блок кэшируется по всем входным данным, поэтому при вводе в одно поле
+        предпросмотр заново растеризует только этот блок.
+        """
+        key = ('text', header, text, max_chars_per_line, line_step, header_font, data_font)
+        layer = layer_cache.get(key)
+        if layer is not None:
+            return layer
+        
+        lines = self.wrap_text(text, max_chars_per_line)
+        header_width = header_font.getlength(header)
+        data_x = header_width + 10
+        
+        # Позиции строк относительно левого верхнего угла блока: (x, y, текст, шрифт)
+        items = [(0, 0, header, header_font)]
+        for i, line in enumerate(lines):
+            items.append((data_x if i == 0 else 0, i * line_step, line, data_font))
+        
+        right = bottom = 0
+        for x, y, line, font in items:
+            bbox = font.getbbox(line)
+            right = max(right, x + bbox[2])
+            bottom = max(bottom, y + bbox[3])
+        
+        mask = Image.new('L', (int(right) + 2 * TEXT_LAYER_PADDING, int(bottom) + 2 * TEXT_LAYER_PADDING), 0)
+        mask_draw = ImageDraw.Draw(mask)
+        for x, y, line, font in items:
+            mask_draw.text((x + TEXT_LAYER_PADDING, y + TEXT_LAYER_PADDING), line, fill=255, font=font)
+        
+        layer = (mask, len(lines) * line_step)
+        layer_cache.put(key, layer)
+        return layer
+    
+    def paste_text_layer(self, image, y_offset, layer):
+        """Накладывает текстовый блок черным цветом и возвращает позицию следующего блока"""
+        mask, height = layer
+        image.paste("black", (50 - TEXT_LAYER_PADDING, y_offset - TEXT_LAYER_PADDING), mask)
+        return y_offset + height
+    
+    def get_photo_layer(self, photo_path, convert_photo_to_bw=True, convert_pattern_to_bw=False):
+        """Возвращает подготовленное фото (квадрат, не больше 180x180) из кэша по содержимому файла.
+
+        Ключ - хэш содержимого, поэтому кэш работает и для временных файлов,
+        которые веб-интерфейс создает для каждого предпросмотра.
+        """
+        with open(photo_path, "rb") as f:
+            photo_bytes = f.read()
+        key = ('photo', hashlib.sha1(photo_bytes).hexdigest(), convert_photo_to_bw, convert_pattern_to_bw)
+        user_photo = layer_cache.get(key)
+        if user_photo is not None:
+            return user_photo
+        
+        with Image.open(BytesIO(photo_bytes)) as source:
+            user_photo = source
+            if convert_photo_to_bw and user_photo.mode != 'L':
+                user_photo = ImageOps.grayscale(user_photo)
+            
+            user_photo = self.crop_to_square(user_photo)
+            
+            user_photo.thumbnail((180, 180))
+            
+            if convert_pattern_to_bw and user_photo.mode != 'L':
+                user_photo = ImageOps.grayscale(user_photo)
+        
+        layer_cache.put(key, user_photo)
+        return user_photo
+    
+    def create_profile_image(self, data, recover_mode=False, update_mode=False, preview_mode=False, convert_pattern_to_bw=False,
+                             photo_path=None, convert_photo_to_bw=True):
+        """Создает изображение профиля на основе данных.
+
+        Фон, текст, QR-код и фото собираются в памяти; файл пропуска
+        записывается один раз, в режиме предпросмотра возвращается изображение.
+        """
         template_settings = self.current_template
         
         pattern_path = self.resolve_pattern_path(template_settings.get("pattern"))
@@ -439,141 +550,57 @@ class ProfileManager:
         data_font_size_normal = template_settings.get("data_font_size_normal", 16)
         
         try:
-            template = Image.open(pattern_path)
+            # Фон декодируется один раз; каждая отрисовка начинается с копии из кэша
+            template = load_cached_image(pattern_path, convert_pattern_to_bw, prepare_pattern).copy()
         except FileNotFoundError:
             print(f"Ошибка: Паттерн не найден: {pattern_path}")
             template = Image.new('RGB', (800, 500), color='white')
-
-        if convert_pattern_to_bw and template.mode != 'L':
-            template = ImageOps.grayscale(template)
+            if convert_pattern_to_bw:
+                template = ImageOps.grayscale(template)
 
         draw = ImageDraw.Draw(template)
         
         try:
-            font_normal = ImageFont.truetype(font_path, font_size_normal)
-            data_font_normal = ImageFont.truetype(data_font_path, data_font_size_normal)
+            font_normal = get_font(font_path, font_size_normal)
+            data_font_normal = get_font(data_font_path, data_font_size_normal)
         except Exception as e:
             print(f"Ошибка загрузки шрифтов: {e}")
             font_normal = ImageFont.load_default()
             data_font_normal = ImageFont.load_default()
 
-        text_area_width = template.width // 2 + 100
+        # Текстовые блоки растеризуются в кэшируемые маски и накладываются на фон
         y_offset = 50
-        
-        # ФИО
-        draw.text((50, y_offset), "ФИО:", fill="black", font=font_normal)
-        
-        fio_text = data['full_name']
-        fio_lines = self.wrap_text(fio_text, 30)
-        
-        header_width = draw.textlength("ФИО:", font=font_normal)
-        data_x = 50 + header_width + 10
-        
-        for i, line in enumerate(fio_lines):
-            if i == 0:
-                draw.text((data_x, y_offset), line, fill="black", font=data_font_normal)
-                y_offset += 30
-            else:
-                draw.text((50, y_offset), line, fill="black", font=data_font_normal)
-                y_offset += 30
-
-        # Организация
-        draw.text((50, y_offset), "Организация:", fill="black", font=font_normal)
-        
-        org_text = data['organization']
-        org_lines = self.wrap_text(org_text, 25)
-        
-        header_width = draw.textlength("Организация:", font=font_normal)
-        data_x = 50 + header_width + 10
-        
-        for i, line in enumerate(org_lines):
-            if i == 0:
-                draw.text((data_x, y_offset), line, fill="black", font=data_font_normal)
-                y_offset += 25
-            else:
-                draw.text((50, y_offset), line, fill="black", font=data_font_normal)
-                y_offset += 25
-    
-        # Отдел
-        draw.text((50, y_offset), "Отдел:", fill="black", font=font_normal)
-        
-        dept_text = data['department']
-        dept_lines = self.wrap_text(dept_text, 35)
-        
-        header_width = draw.textlength("Отдел:", font=font_normal)
-        data_x = 50 + header_width + 10
-        
-        for i, line in enumerate(dept_lines):
-            if i == 0:
-                draw.text((data_x, y_offset), line, fill="black", font=data_font_normal)
-                y_offset += 25
-            else:
-                draw.text((50, y_offset), line, fill="black", font=data_font_normal)
-                y_offset += 25
+        y_offset = self.paste_text_layer(template, y_offset,
+                                         self.get_text_layer("ФИО:", data['full_name'], 30, 30, font_normal, data_font_normal))
+        y_offset = self.paste_text_layer(template, y_offset,
+                                         self.get_text_layer("Организация:", data['organization'], 25, 25, font_normal, data_font_normal))
+        y_offset = self.paste_text_layer(template, y_offset,
+                                         self.get_text_layer("Отдел:", data['department'], 35, 25, font_normal, data_font_normal))
     
         # Срок действия
         if 'expiration_date' in data:
             expiration_display = self.format_date_for_display(data['expiration_date'])
+            y_offset = self.paste_text_layer(template, y_offset,
+                                             self.get_text_layer("Действителен до:", expiration_display, 35, 30, font_normal, data_font_normal))
             
-            draw.text((50, y_offset), "Действителен до:", fill="black", font=font_normal)
-            
-            expiration_text = expiration_display
-            expiration_lines = self.wrap_text(expiration_text, 35)
-            
-            header_width = draw.textlength("Действителен до:", font=font_normal)
-            data_x = 50 + header_width + 10
-            
-            for i, line in enumerate(expiration_lines):
-                if i == 0:
-                    draw.text((data_x, y_offset), line, fill="black", font=data_font_normal)
-                    y_offset += 30
-                else:
-                    draw.text((50, y_offset), line, fill="black", font=data_font_normal)
-                    y_offset += 30
-            
-            try:
-                timer_image_path = self.get_full_path("interface/timer.png")
-                timer_image = Image.open(timer_image_path)
-                
-                if timer_image.mode == 'RGBA':
-                    background = Image.new('RGB', timer_image.size, (255, 255, 255))
-                    background.paste(timer_image, mask=timer_image.split()[3])
-                    timer_image = background
-                
-                if convert_pattern_to_bw and timer_image.mode != 'L':
-                    timer_image = ImageOps.grayscale(timer_image)
-                
-                timer_image.thumbnail((100, 100))
-                template.paste(timer_image, (20, template.height - timer_image.height - 20))
-            except FileNotFoundError:
+            timer_image = None
+            for timer_name in ("interface/timer.png", "interface/timer.bmp"):
                 try:
-                    timer_image_path = self.get_full_path("interface/timer.bmp")
-                    timer_image = Image.open(timer_image_path)
-                    if convert_pattern_to_bw and timer_image.mode != 'L':
-                        timer_image = ImageOps.grayscale(timer_image)
-                    timer_image.thumbnail((100, 100))
-                    template.paste(timer_image, (20, template.height - timer_image.height - 20))
+                    timer_image = load_cached_image(self.get_full_path(timer_name), convert_pattern_to_bw, prepare_timer)
+                    break
                 except FileNotFoundError:
-                    draw.text((20, template.height - 40), "ВРЕМЕННЫЙ", fill="black", font=font_normal)
+                    continue
+            
+            if timer_image is not None:
+                template.paste(timer_image, (20, template.height - timer_image.height - 20))
+            else:
+                draw.text((20, template.height - 40), "ВРЕМЕННЫЙ", fill="black", font=font_normal)
 
         # QR-код
         try:
-            qr = qrcode.QRCode(
-                version=1,
-                box_size=10,
-                border=2,
-                error_correction=qrcode.constants.ERROR_CORRECT_L
-            )
-            qr.add_data(data['ID'])
-            qr.make(fit=True)
-            
-            qr_image = qr.make_image(fill_color="black", back_color="white")
-            
+            # QR-код в оттенках серого подходит и для цветного, и для черно-белого пропуска
             qr_size = min(template.width // 2, template.height // 2, 200)
-            qr_image = qr_image.resize((qr_size, qr_size), Image.Resampling.LANCZOS)
-            
-            if convert_pattern_to_bw and qr_image.mode != 'L':
-                qr_image = ImageOps.grayscale(qr_image)
+            qr_image = render_qr_image(self.get_qr_payload(data, preview_mode), qr_size)
             
             qr_position = (template.width - qr_image.width - 68, template.height - qr_image.height - 28)
             
@@ -584,6 +611,10 @@ class ProfileManager:
             draw.text((template.width - 150, template.height - 30), 
                      f"ID: {data['ID']}", fill="black", font=font_normal)
 
+        # Фото пользователя: при выпуске пропуска ошибка прерывает создание, в предпросмотре - нет
+        self.paste_user_photo(template, photo_path, convert_photo_to_bw=convert_photo_to_bw,
+                              convert_pattern_to_bw=convert_pattern_to_bw, raise_errors=not preview_mode)
+
         if preview_mode:
             if template.mode == 'RGBA':
                 template = template.convert('RGB')
@@ -623,78 +654,27 @@ class ProfileManager:
         
         return cropped_image
     
-    def add_user_photo_to_image(self, profile_image, photo_path, convert_photo_to_bw=True, convert_pattern_to_bw=False):
-        """Добавляет фото пользователя к изображению профиля в памяти"""
-        if not photo_path or not os.path.exists(photo_path):
-            return profile_image
-            
-        try:
-            result_image = profile_image.copy()
-            
-            user_photo = Image.open(photo_path)
-            
-            if convert_photo_to_bw and user_photo.mode != 'L':
-                user_photo = ImageOps.grayscale(user_photo)
-            
-            user_photo = self.crop_to_square(user_photo)
-            
-            user_photo.thumbnail((180, 180))
-            
-            photo_x = result_image.width - user_photo.width - 80
-            photo_y = 35
-            
-            if convert_pattern_to_bw and user_photo.mode != 'L':
-                user_photo = ImageOps.grayscale(user_photo)
-            
-            result_image.paste(user_photo, (photo_x, photo_y))
-            
-            user_photo.close()
-            
-            return result_image
-            
-        except Exception as e:
-            print(f"Не удалось добавить фото пользователя: {str(e)}")
-            return profile_image
-    
-    def add_user_photo(self, profile_image_path, photo_path, convert_photo_to_bw=True, convert_pattern_to_bw=False):
-        """Добавляет фото пользователя на изображение профиля"""
+    def paste_user_photo(self, image, photo_path, convert_photo_to_bw=True, convert_pattern_to_bw=False, raise_errors=True):
+        """Накладывает фото пользователя на изображение профиля в памяти"""
         if not photo_path or not os.path.exists(photo_path):
             return
             
         try:
-            profile = Image.open(profile_image_path)
+            user_photo = self.get_photo_layer(photo_path, convert_photo_to_bw, convert_pattern_to_bw)
             
-            if convert_pattern_to_bw and profile.mode != 'L':
-                profile = ImageOps.grayscale(profile)
-            
-            user_photo = Image.open(photo_path)
-            
-            if convert_photo_to_bw and user_photo.mode != 'L':
-                user_photo = ImageOps.grayscale(user_photo)
-            
-            user_photo = self.crop_to_square(user_photo)
-            
-            user_photo.thumbnail((180, 180))
-            
-            photo_x = profile.width - user_photo.width - 80
+            photo_x = image.width - user_photo.width - 80
             photo_y = 35
             
-            if convert_pattern_to_bw and user_photo.mode != 'L':
-                user_photo = ImageOps.grayscale(user_photo)
-            
-            profile.paste(user_photo, (photo_x, photo_y))
-            profile.save(profile_image_path)
-            
-            profile.close()
-            user_photo.close()
+            image.paste(user_photo, (photo_x, photo_y))
             
         except Exception as e:
             print(f"Не удалось добавить фото пользователя: {str(e)}")
-            raise
+            if raise_errors:
+                raise
     
     def get_profiles_count(self):
         """Возвращает количество профилей в системе"""
-        return len(self.existing_data)
+        return len(self.profiles)
     
     def get_add_30_days_date(self):
         """Возвращает дату +30 дней от текущей"""
@@ -753,7 +733,7 @@ class ProfileManager:
             return True
         return False
     
-    def preview_profile_image(self, data, convert_pattern_to_bw=False, template_name=None):
+    def preview_profile_image(self, data, convert_pattern_to_bw=False, template_name=None, photo_path=None, convert_photo_to_bw=True):
         """Создает изображение для предпросмотра"""
         old_template = self.current_template
         
@@ -762,7 +742,8 @@ class ProfileManager:
             if template:
                 self.current_template = template
         
-        preview_image = self.create_profile_image(data, preview_mode=True, convert_pattern_to_bw=convert_pattern_to_bw)
+        preview_image = self.create_profile_image(data, preview_mode=True, convert_pattern_to_bw=convert_pattern_to_bw,
+                                                  photo_path=photo_path, convert_photo_to_bw=convert_photo_to_bw)
         
         if template_name and template_name != "default":
             self.current_template = old_template
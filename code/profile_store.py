@@ -0,0 +1,629 @@
+# profile_store.py - Хранилища профилей: журнал data_user.md и SQLite
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+try:
+    import msvcrt  # Блокировка файлов в Windows
+except ImportError:
+    msvcrt = None
+    import fcntl
+
+# Выбор хранилища профилей: "markdown" (database/data_user.md) или "sqlite"
+STORAGE_BACKEND = "markdown"
+MARKDOWN_DB_NAME = "data_user.md"
+SQLITE_DB_NAME = "data_user.sqlite3"
+
+BLOCK_SEPARATOR = "---"
+TOMBSTONE_KEY = "deleted"
+
+# Настройки фонового сжатия журнала
+COMPACT_MIN_DEAD = 64  # Минимальное число устаревших блоков для запуска сжатия
+COMPACT_RATIO = 0.5  # Доля устаревших блоков относительно живых записей
+LOCK_SUFFIX = ".lock"  # Файл межпроцессной блокировки рядом с файлом данных
+WRITER_LOCK_NAME = "profiles_writer.lock"  # Блокировка программы, изменяющей профили
+
+# Сколько последних изменений хранится в журнале SQLite; считыватель, отставший сильнее, перезагружает базу целиком
+PROFILE_CHANGES_KEEP = 10000
+
+
+def serialize_record(record):
+    """Формирует текстовый блок записи в формате data_user.md"""
+    lines = [BLOCK_SEPARATOR]
+    lines.extend(f"{key}: {value}" for key, value in record.items())
+    lines.append("")
+    lines.append("")
+    return "\n".join(lines)
+
+
+def parse_block(text):
+    """Разбирает текстовый блок в словарь"""
+    record = {}
+    for line in text.split('\n'):
+        if ':' in line:
+            key, value = line.split(':', 1)
+            record[key.strip()] = value.strip()
+    return record
+
+
+def is_tombstone(record):
+    """Проверяет, является ли запись отметкой об удалении"""
+    return str(record.get(TOMBSTONE_KEY, '')).strip().lower() == 'true'
+
+
+class FileLock:
+    """Межпроцессная блокировка на отдельном файле (msvcrt в Windows, flock в остальных ОС)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.handle = None
+
+    def acquire(self, blocking=True):
+        """Захватывает блокировку; при blocking=False возвращает False, если она занята"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        handle = open(self.path, "a+b")
+        try:
+            if msvcrt:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            if blocking:
+                raise
+            return False
+        self.handle = handle
+        return True
+
+    def release(self):
+        """Снимает блокировку"""
+        if self.handle is None:
+            return
+        try:
+            if msvcrt:
+                self.handle.seek(0)
+                msvcrt.locking(self.handle.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self.handle.close()  # flock снимается при закрытии файла
+            self.handle = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class ProfileStore:
+    """Хранилище профилей: дозапись блоков, индекс ID → смещение и фоновое сжатие.
+
+    Каждое создание или изменение дописывает в конец файла полный блок записи,
+    удаление дописывает блок-отметку ``deleted: True``. Последний блок с данным
+    ID считается актуальным, поэтому файл остается читаемым человеком и
+    совместимым с reader.py. Дозапись, сжатие и перезапись файла выполняются
+    под межпроцессной блокировкой, поэтому файл могут менять несколько процессов.
+    """
+
+    def __init__(self, data_file, compact_min_dead=COMPACT_MIN_DEAD, compact_ratio=COMPACT_RATIO):
+        self.data_file = data_file
+        self.compact_min_dead = compact_min_dead
+        self.compact_ratio = compact_ratio
+        self.offsets = {}  # ID -> (смещение, длина) актуального блока в байтах
+        self.block_count = 0  # Всего блоков в файле, включая устаревшие
+        self.file_size = 0
+        self.read_cursor = None  # (inode, прочитано байт, SHA-1 прочитанной части) после последней загрузки
+        self.lock = threading.RLock()
+        self.file_lock = FileLock(data_file + LOCK_SUFFIX)
+        self.compact_thread = None
+
+    def load(self):
+        """Читает файл, строит индекс смещений и возвращает список актуальных записей"""
+        with self.lock:
+            self.offsets = {}
+            self.block_count = 0
+            self.file_size = 0
+            self.read_cursor = None
+
+            if not os.path.exists(self.data_file):
+                return []
+
+            raw, inode = self._read_file()
+            self.read_cursor = (inode, len(raw), hashlib.sha1(raw).digest())
+            records = {}
+            for offset, length, text in self._iter_blocks(raw):
+                self.block_count += 1
+                record = parse_block(text)
+                user_id = record.get('ID')
+                if not user_id:
+                    continue
+                if is_tombstone(record):
+                    records.pop(user_id, None)
+                    self.offsets.pop(user_id, None)
+                else:
+                    records[user_id] = record
+                    self.offsets[user_id] = (offset, length)
+
+            self.file_size = len(raw)
+            return list(records.values())
+
+    def read_changes(self, cursor):
+        """Читает блоки, дописанные после позиции cursor.
+
+        Возвращает (список пар (ID, запись или None при удалении), новая позиция)
+        или None, если нужна полная загрузка: файл заменен, укорочен или изменен
+        не дозаписью (прочитанная часть не совпадает с SHA-1 из cursor).
+        """
+        if cursor is None:
+            return None
+        inode, position, fingerprint = cursor
+        with self.lock:
+            try:
+                raw, current_inode = self._read_file()
+            except FileNotFoundError:
+                return None
+        if current_inode != inode or len(raw) < position:
+            return None
+        digest = hashlib.sha1(raw[:position])
+        if digest.digest() != fingerprint:
+            return None
+
+        tail = raw[position:]
+        changes = []
+        blocks, consumed = self._complete_blocks(tail)
+        for offset, length, text in blocks:
+            record = parse_block(text)
+            user_id = record.get('ID')
+            if not user_id:
+                continue
+            changes.append((user_id, None if is_tombstone(record) else record))
+
+        digest.update(tail[:consumed])
+        return changes, (inode, position + consumed, digest.digest())
+
+    def _read_file(self):
+        """Читает файл целиком под межпроцессной блокировкой, чтобы не застать блок на середине дозаписи.
+
+        Возвращает (содержимое, inode). Если файл блокировки недоступен
+        (например, база открыта только для чтения), файл читается без нее.
+        """
+        try:
+            self.file_lock.acquire()
+            locked = True
+        except OSError:
+            locked = False
+        try:
+            with open(self.data_file, "rb") as f:
+                return f.read(), os.fstat(f.fileno()).st_ino
+        finally:
+            if locked:
+                self.file_lock.release()
+
+    def _complete_blocks(self, raw):
+        """Блоки, запись которых завершена, и длина прочитанной части.
+
+        Дозапись идет под блокировкой, но файл может менять и программа без
+        нее: последний блок дописанной части без пустой строки в конце
+        считается недописанным и читается в следующий раз.
+        """
+        blocks = list(self._iter_blocks(raw))
+        if not blocks:
+            return [], raw.rfind(b"\n") + 1
+        offset, length, _ = blocks[-1]
+        block = raw[offset:offset + length]
+        if not (block.endswith(b"\n\n") or block.endswith(b"\r\n\r\n")):
+            blocks.pop()
+            return blocks, offset
+        return blocks, len(raw)
+
+    def _iter_blocks(self, raw):
+        """Перебирает блоки в байтовом содержимом: (смещение, длина, текст)"""
+        block_start = None
+        position = 0
+        for line in raw.splitlines(keepends=True):
+            if line.strip() == BLOCK_SEPARATOR.encode():
+                if block_start is not None:
+                    yield self._decode_block(raw, block_start, position)
+                block_start = position
+            position += len(line)
+        if block_start is not None:
+            yield self._decode_block(raw, block_start, position)
+
+    def _decode_block(self, raw, start, end):
+        """Декодирует блок без строки-разделителя"""
+        text = raw[start:end].decode("utf-8").replace('\r\n', '\n')
+        body = text.split('\n', 1)[1] if '\n' in text else ''
+        return start, end - start, body
+
+    def _append_blocks(self, texts):
+        """Дописывает блоки в конец файла одной записью и возвращает их (смещение, длина)"""
+        chunks = [text.encode("utf-8") for text in texts]
+        os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
+        with self.file_lock, open(self.data_file, "a+b") as f:
+            f.seek(0, os.SEEK_END)
+            offset = f.tell()
+            if offset > 0:
+                # Разделитель блока должен начинаться с новой строки
+                f.seek(offset - 1)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+                    offset += 1
+            f.write(b"".join(chunks))
+            f.flush()
+        locations = []
+        for chunk in chunks:
+            locations.append((offset, len(chunk)))
+            offset += len(chunk)
+        self.file_size = offset
+        self.block_count += len(chunks)
+        return locations
+
+    def _append_block(self, text):
+        """Дописывает блок в конец файла и возвращает его смещение"""
+        return self._append_blocks([text])[0]
+
+    def put(self, record):
+        """Сохраняет создание или изменение записи"""
+        user_id = record.get('ID')
+        if not user_id:
+            raise ValueError("Запись профиля должна содержать ID")
+        with self.lock:
+            self.offsets[user_id] = self._append_block(serialize_record(record))
+        self.maybe_compact()
+
+    def put_many(self, records):
+        """Сохраняет пачку записей одной дозаписью в файл"""
+        if any(not record.get('ID') for record in records):
+            raise ValueError("Запись профиля должна содержать ID")
+        if not records:
+            return
+        with self.lock:
+            locations = self._append_blocks([serialize_record(record) for record in records])
+            for record, location in zip(records, locations):
+                self.offsets[record['ID']] = location
+        self.maybe_compact()
+
+    def delete(self, user_id):
+        """Сохраняет удаление записи в виде блока-отметки"""
+        with self.lock:
+            if user_id not in self.offsets:
+                return False
+            self._append_block(serialize_record({'ID': user_id, TOMBSTONE_KEY: True}))
+            del self.offsets[user_id]
+        self.maybe_compact()
+        return True
+
+    def read(self, user_id):
+        """Читает актуальную запись с диска по индексу смещений"""
+        with self.lock:
+            location = self.offsets.get(user_id)
+            if location is None:
+                return None
+            offset, length = location
+            with open(self.data_file, "rb") as f:
+                f.seek(offset)
+                raw = f.read(length)
+        for _, _, text in self._iter_blocks(raw):
+            return parse_block(text)
+        return None
+
+    def rewrite(self, records):
+        """Полностью перезаписывает файл переданными записями"""
+        content = "".join(serialize_record(record) for record in records)
+        with self.lock:
+            with self.file_lock:
+                self._replace_file(content.encode("utf-8"))
+            self.load()
+
+    def dead_blocks(self):
+        """Количество устаревших блоков в файле"""
+        return self.block_count - len(self.offsets)
+
+    def needs_compaction(self):
+        """Проверяет, стоит ли сжимать журнал"""
+        dead = self.dead_blocks()
+        return dead >= self.compact_min_dead and dead > len(self.offsets) * self.compact_ratio
+
+    def maybe_compact(self):
+        """Запускает фоновое сжатие журнала при накоплении устаревших блоков"""
+        with self.lock:
+            if not self.needs_compaction():
+                return
+            if self.compact_thread is not None and self.compact_thread.is_alive():
+                return
+            self.compact_thread = threading.Thread(target=self.compact, daemon=True)
+            self.compact_thread.start()
+
+    def wait_for_compaction(self):
+        """Ожидает завершения фонового сжатия"""
+        thread = self.compact_thread
+        if thread is not None:
+            thread.join()
+
+    def compact(self):
+        """Переписывает файл, оставляя только актуальные блоки.
+
+        Файл перечитывается целиком под межпроцессной блокировкой, поэтому
+        блоки, дописанные другими процессами, тоже сохраняются.
+        """
+        try:
+            with self.lock, self.file_lock:
+                with open(self.data_file, "rb") as f:
+                    raw = f.read()
+
+                latest = {}  # ID -> байты актуального блока в порядке первого появления
+                for offset, length, text in self._iter_blocks(raw):
+                    record = parse_block(text)
+                    user_id = record.get('ID')
+                    if not user_id:
+                        continue
+                    if is_tombstone(record):
+                        latest.pop(user_id, None)
+                    else:
+                        latest[user_id] = raw[offset:offset + length]
+
+                offsets = {}
+                position = 0
+                for user_id, chunk in latest.items():
+                    offsets[user_id] = (position, len(chunk))
+                    position += len(chunk)
+
+                self._replace_file(b"".join(latest.values()))
+                self.offsets = offsets
+                self.block_count = len(offsets)
+        except Exception as e:
+            print(f"Ошибка сжатия базы данных: {e}")
+
+    def change_token(self):
+        """Признак версии файла для обнаружения изменений другими процессами"""
+        try:
+            stat = os.stat(self.data_file)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime, stat.st_size
+
+    def _replace_file(self, data):
+        """Атомарно заменяет файл данных новым содержимым"""
+        os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
+        temp_file = self.data_file + ".tmp"
+        with open(temp_file, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, self.data_file)
+        self.file_size = len(data)
+
+
+# Поля профиля, хранящиеся в отдельных столбцах SQLite; остальные попадают в extra (JSON)
+PROFILE_COLUMNS = [
+    "ID",
+    "full_name",
+    "organization",
+    "department",
+    "created_at",
+    "updated_at",
+    "expiration_date",
+    "is_temporary",
+]
+
+
+class SQLiteProfileStore:
+    """Хранилище профилей во встроенной базе SQLite (режим WAL).
+
+    Повторяет интерфейс ProfileStore, поэтому ProfileManager и reader.py
+    работают с ним одинаково. В режиме WAL читатели не блокируют запись.
+    """
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self.read_cursor = None  # Номер последнего изменения на момент загрузки
+        os.makedirs(os.path.dirname(db_file), exist_ok=True)
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(db_file, check_same_thread=False, timeout=10)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.create_schema()
+
+    def create_schema(self):
+        """Создает таблицы и индексы, если их еще нет"""
+        with self.lock, self.connection:
+            self.connection.execute(
+                """CREATE TABLE IF NOT EXISTS profiles (
+                    ID TEXT PRIMARY KEY,
+                    full_name TEXT,
+                    organization TEXT,
+                    department TEXT,
+                    created_at TEXT,
+                    updated_at TEXT,
+                    expiration_date TEXT,
+                    is_temporary INTEGER,
+                    extra TEXT
+                )"""
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS idx_profiles_full_name ON profiles(full_name)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS idx_profiles_expiration ON profiles(expiration_date)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            # Журнал изменений для инкрементальной перезагрузки в reader.py
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS profile_changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, ID TEXT NOT NULL)"
+            )
+            for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+                self.connection.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS profiles_{event.lower()}_change AFTER {event} ON profiles "
+                    f"BEGIN INSERT INTO profile_changes (ID) VALUES ({row}.ID); END"
+                )
+
+    def _to_row(self, record):
+        """Преобразует запись профиля в строку таблицы"""
+        row = []
+        for column in PROFILE_COLUMNS:
+            value = record.get(column)
+            if column == "is_temporary":
+                value = None if value is None else int(str(value).lower() == 'true')
+            elif value is not None:
+                value = str(value)
+            row.append(value)
+        extra = {key: str(value) for key, value in record.items() if key not in PROFILE_COLUMNS}
+        row.append(json.dumps(extra, ensure_ascii=False) if extra else None)
+        return row
+
+    def _from_row(self, row):
+        """Преобразует строку таблицы в запись профиля"""
+        record = {}
+        for column, value in zip(PROFILE_COLUMNS, row):
+            if value is None:
+                continue
+            record[column] = bool(value) if column == "is_temporary" else value
+        if row[-1]:
+            record.update(json.loads(row[-1]))
+        return record
+
+    def load(self):
+        """Возвращает список всех профилей в порядке добавления"""
+        with self.lock:
+            # Позиция берется до чтения: изменения между запросами будут прочитаны повторно
+            self.read_cursor = self._last_change()
+            rows = self.connection.execute(
+                f"SELECT {', '.join(PROFILE_COLUMNS)}, extra FROM profiles ORDER BY rowid"
+            ).fetchall()
+        return [self._from_row(row) for row in rows]
+
+    def _last_change(self):
+        """Номер последнего записанного изменения"""
+        return self.connection.execute("SELECT COALESCE(MAX(seq), 0) FROM profile_changes").fetchone()[0]
+
+    def _prune_changes(self):
+        """Удаляет из журнала изменений все, кроме последних PROFILE_CHANGES_KEEP записей"""
+        self.connection.execute(
+            "DELETE FROM profile_changes WHERE seq <= (SELECT MAX(seq) FROM profile_changes) - ?",
+            (PROFILE_CHANGES_KEEP,),
+        )
+
+    def read_changes(self, cursor):
+        """Возвращает актуальное состояние профилей, измененных после cursor"""
+        if cursor is None:
+            return None
+        with self.lock:
+            new_cursor = self._last_change()
+            oldest = self.connection.execute("SELECT MIN(seq) FROM profile_changes").fetchone()[0]
+            if new_cursor < cursor or (oldest is not None and cursor < oldest - 1):
+                return None  # Часть изменений уже удалена из журнала
+            user_ids = [row[0] for row in self.connection.execute(
+                "SELECT DISTINCT ID FROM profile_changes WHERE seq > ? AND seq <= ?", (cursor, new_cursor)
+            )]
+            changes = [(user_id, self.read(user_id)) for user_id in user_ids]
+        return changes, new_cursor
+
+    def put(self, record):
+        """Сохраняет создание или изменение записи"""
+        self.put_many([record])
+
+    def put_many(self, records):
+        """Сохраняет пачку записей в одной транзакции"""
+        if any(not record.get('ID') for record in records):
+            raise ValueError("Запись профиля должна содержать ID")
+        columns = PROFILE_COLUMNS + ["extra"]
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns[1:])
+        with self.lock, self.connection:
+            self.connection.executemany(
+                f"INSERT INTO profiles ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT(ID) DO UPDATE SET {updates}",
+                [self._to_row(record) for record in records],
+            )
+            self._prune_changes()
+
+    def delete(self, user_id):
+        """Удаляет запись"""
+        with self.lock, self.connection:
+            cursor = self.connection.execute("DELETE FROM profiles WHERE ID = ?", (user_id,))
+            self._prune_changes()
+        return cursor.rowcount > 0
+
+    def read(self, user_id):
+        """Читает запись по ID"""
+        with self.lock:
+            row = self.connection.execute(
+                f"SELECT {', '.join(PROFILE_COLUMNS)}, extra FROM profiles WHERE ID = ?", (user_id,)
+            ).fetchone()
+        return self._from_row(row) if row else None
+
+    def rewrite(self, records):
+        """Полностью заменяет содержимое таблицы в одной транзакции"""
+        columns = PROFILE_COLUMNS + ["extra"]
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM profiles")
+            self.connection.executemany(
+                f"INSERT INTO profiles ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [self._to_row(record) for record in records],
+            )
+            self._prune_changes()
+
+    def maybe_compact(self):
+        """Сжатие не требуется: SQLite управляет файлом сам"""
+
+    def wait_for_compaction(self):
+        """Сжатие не требуется: SQLite управляет файлом сам"""
+
+    def change_token(self):
+        """Признак версии базы: меняется после фиксации транзакции другим соединением"""
+        with self.lock:
+            return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def get_meta(self, key):
+        """Читает служебное значение"""
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        """Сохраняет служебное значение"""
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, str(value)),
+            )
+
+    def close(self):
+        """Закрывает соединение с базой"""
+        with self.lock:
+            self.connection.close()
+
+
+def migrate_markdown_to_sqlite(markdown_file, sqlite_store):
+    """Однократно переносит профили из data_user.md в SQLite"""
+    if sqlite_store.get_meta("migrated_from_markdown"):
+        return 0
+    records = ProfileStore(markdown_file).load() if os.path.exists(markdown_file) else []
+    if records:
+        sqlite_store.rewrite(records)
+        print(f"Перенесено {len(records)} профилей из {markdown_file} в SQLite")
+    sqlite_store.set_meta("migrated_from_markdown", os.path.basename(markdown_file))
+    return len(records)
+
+
+def lock_profile_writer(database_dir):
+    """Захватывает блокировку программы, изменяющей профили; None, если ее держит другой процесс.
+
+    Программа держит профили в памяти и не видит чужих изменений, поэтому
+    менять базу одновременно может только одна. Блокировка снимается при
+    завершении процесса.
+    """
+    lock = FileLock(os.path.join(database_dir, WRITER_LOCK_NAME))
+    return lock if lock.acquire(blocking=False) else None
+
+
+def open_profile_store(database_dir, backend=None):
+    """Создает хранилище профилей выбранного типа в папке database"""
+    backend = backend or STORAGE_BACKEND
+    markdown_file = os.path.join(database_dir, MARKDOWN_DB_NAME)
+    if backend == "sqlite":
+        store = SQLiteProfileStore(os.path.join(database_dir, SQLITE_DB_NAME))
+        migrate_markdown_to_sqlite(markdown_file, store)
+        return store
+    if backend == "markdown":
+        return ProfileStore(markdown_file)
+    raise ValueError(f"Неизвестный тип хранилища профилей: {backend}")
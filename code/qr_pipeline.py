@@ -0,0 +1,304 @@
+# qr_pipeline.py - Захват кадров и многопоточное распознавание QR-кодов
+import os
+import threading
+import time
+import cv2
+
+# Количество потоков распознавания: ядро оставляем под захват и отображение
+DECODE_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+RESULT_DISPLAY_TIME = 0.5  # Сколько секунд рамка найденного QR-кода остается на экране
+
+# Режим распознавания: "two_stage" - поиск на уменьшенном кадре и декодирование только области кода,
+# "full" - detectAndDecode по всему кадру в полном разрешении
+QR_DETECT_MODE = "two_stage"
+DETECT_SCALE = 0.5  # Масштаб кадра для поиска кода
+ROI_MARGIN = 0.15  # Запас вокруг найденного кода относительно его размера
+# Если на уменьшенном кадре код не найден, кадр с движением распознается целиком:
+# мелкие коды (дальше от камеры) на уменьшенном кадре не находятся
+FULL_FRAME_FALLBACK = True
+
+# Пропуск распознавания на статичных кадрах
+MOTION_GATE_ENABLED = True
+MOTION_FRAME_WIDTH = 160  # Ширина уменьшенного кадра для сравнения
+MOTION_PIXEL_DELTA = 25  # Изменение яркости пикселя, считающееся движением
+MOTION_THRESHOLD = 0.01  # Доля изменившихся пикселей, при которой кадр распознается
+IDLE_DECODE_FPS = 2  # Частота распознавания при отсутствии движения
+TRACK_HOLD_TIME = 1.0  # Сколько секунд после обнаружения кандидата распознаются все кадры
+
+REPLAY_IMAGE_EXTENSIONS = ('.bmp', '.png', '.jpg', '.jpeg')  # Кадры, читаемые из папки в режиме воспроизведения
+REPLAY_FPS = 30  # Частота кадров папки изображений (и видео без сведений о частоте) в режиме воспроизведения
+
+
+def decode_qr(frame, detector):
+    """Декодирование QR-кода детектором OpenCV.
+
+    Возвращает (данные, углы); если код найден, но не прочитан - (None, углы),
+    если не найден - (None, None).
+    """
+    try:
+        data, bbox, _ = detector.detectAndDecode(frame)
+        if bbox is not None:
+            return data or None, bbox.reshape(-1, 2).astype(int)
+    except cv2.error:
+        pass
+    return None, None
+
+
+def decode_qr_two_stage(frame, detector, scale=DETECT_SCALE, margin=ROI_MARGIN, full_fallback=False):
+    """Двухэтапное распознавание: поиск кода на уменьшенном сером кадре, затем декодирование области.
+
+    Декодирование идет только по вырезанной области полного разрешения. Кадр
+    без кандидатов при full_fallback распознается целиком, иначе не декодируется.
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    try:
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        found, candidate = detector.detect(small)
+        if not found or candidate is None:
+            return decode_qr(gray, detector) if full_fallback else (None, None)
+
+        corners = candidate.reshape(-1, 2) / scale
+        x0, y0 = corners.min(axis=0)
+        x1, y1 = corners.max(axis=0)
+        pad = margin * max(x1 - x0, y1 - y0)
+        height, width = gray.shape[:2]
+        left, top = max(0, int(x0 - pad)), max(0, int(y0 - pad))
+        right, bottom = min(width, int(x1 + pad) + 1), min(height, int(y1 + pad) + 1)
+        if right <= left or bottom <= top:
+            return None, None
+
+        data, points = decode_qr(gray[top:bottom, left:right], detector)
+        if data:
+            return data, points + (left, top)
+        return None, corners.astype(int)
+    except cv2.error:
+        pass
+    return None, None
+
+
+def draw_qr_bbox(frame, points):
+    """Рисует рамку QR-кода на кадре"""
+    n = len(points)
+    for i in range(n):
+        cv2.line(frame, tuple(int(v) for v in points[i]), tuple(int(v) for v in points[(i + 1) % n]), (0, 255, 0), 3)
+
+
+def iter_replay_frames(path):
+    """Кадры записанного видео или папки изображений (по имени файла) для воспроизведения.
+
+    Возвращает пары (кадр, интервал до следующего кадра в секундах) по частоте
+    кадров видео или REPLAY_FPS, чтобы время воспроизведения не зависело от
+    скорости компьютера.
+    """
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            if not name.lower().endswith(REPLAY_IMAGE_EXTENSIONS):
+                continue
+            frame = cv2.imread(os.path.join(path, name))
+            if frame is None:
+                print(f"Не удалось прочитать кадр: {name}")
+                continue
+            yield frame, 1.0 / REPLAY_FPS
+        return
+
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Не удалось открыть видео: {path}")
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        interval = 1.0 / (fps if fps and fps > 0 else REPLAY_FPS)
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame, interval
+    finally:
+        cap.release()
+
+
+class MotionGate:
+    """Решает, нужно ли распознавать кадр: при движении в кадре, при недавно найденном
+    кандидате или с пониженной частотой IDLE_DECODE_FPS на статичной сцене"""
+
+    def __init__(self, threshold=MOTION_THRESHOLD, pixel_delta=MOTION_PIXEL_DELTA,
+                 idle_fps=IDLE_DECODE_FPS, track_hold=TRACK_HOLD_TIME):
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.idle_interval = 1.0 / idle_fps if idle_fps > 0 else float('inf')
+        self.track_hold = track_hold
+        self.previous = None
+        self.moving = True  # Было ли движение в последнем проверенном кадре
+        self.last_pass_time = 0
+        self.passed = 0
+        self.skipped = 0
+
+    def should_decode(self, frame, now, last_candidate_time=0):
+        """Проверяет кадр и запоминает его для следующего сравнения"""
+        height, width = frame.shape[:2]
+        small_size = (MOTION_FRAME_WIDTH, max(1, height * MOTION_FRAME_WIDTH // width))
+        small = cv2.resize(frame, small_size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        small = cv2.GaussianBlur(small, (5, 5), 0)
+
+        moving = True
+        if self.previous is not None:
+            changed = cv2.countNonZero(cv2.threshold(
+                cv2.absdiff(small, self.previous), self.pixel_delta, 255, cv2.THRESH_BINARY)[1])
+            moving = changed > self.threshold * small.size
+        self.previous = small
+        self.moving = moving
+
+        if moving or now - last_candidate_time < self.track_hold or now - self.last_pass_time >= self.idle_interval:
+            self.last_pass_time = now
+            self.passed += 1
+            return True
+        self.skipped += 1
+        return False
+
+
+class QRResult:
+    """Результат распознавания кадра"""
+
+    def __init__(self, frame_id, data, points, decoded_at):
+        self.frame_id = frame_id
+        self.data = data
+        self.points = points
+        self.decoded_at = decoded_at
+
+
+class FrameGrabber:
+    """Поток захвата: непрерывно читает камеру и хранит только последний кадр"""
+
+    def __init__(self, cap):
+        self.cap = cap
+        self.condition = threading.Condition()
+        self.frame = None
+        self.ret = True
+        self.frame_id = 0
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="frame-grabber", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while self.running:
+            ret, frame = self.cap.read()
+            with self.condition:
+                self.ret = ret
+                self.frame = frame if ret else None
+                self.frame_id += 1
+                self.condition.notify_all()
+            if not ret:
+                break
+
+    def read(self, last_frame_id, timeout=2.0):
+        """Ждет кадр новее last_frame_id; возвращает (успех, кадр, номер кадра)"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.frame_id != last_frame_id or not self.ret, timeout)
+            if self.frame_id == last_frame_id:
+                return False, None, last_frame_id
+            return self.ret, self.frame, self.frame_id
+
+    def stop(self):
+        self.running = False
+        self.thread.join(timeout=2.0)
+
+
+class QRDecodeStage:
+    """Пул потоков распознавания с очередью «побеждает последний кадр».
+
+    Каждый поток держит собственный cv2.QRCodeDetector. Новый кадр заменяет
+    еще не взятый в работу, поэтому распознавание никогда не отстает от камеры,
+    а захват и отображение не ждут декодера. on_result(номер кадра, данные, углы),
+    если задан, вызывается потоком распознавания для каждого обработанного кадра.
+    """
+
+    def __init__(self, workers=DECODE_WORKERS, mode=QR_DETECT_MODE, on_result=None):
+        self.mode = mode
+        self.on_result = on_result
+        self.condition = threading.Condition()
+        self.pending = None  # (номер кадра, кадр, было ли движение), ожидающий свободного потока
+        self.result = None  # Последний успешный результат
+        self.submitted = 0
+        self.replaced = 0  # Кадры, замененные более новыми до начала распознавания
+        self.decoded = 0
+        self.busy = 0  # Потоки, распознающие кадр в данный момент
+        self.last_candidate_time = 0  # Когда в последний раз был найден кандидат QR-кода
+        self.running = True
+        self.threads = [
+            threading.Thread(target=self.run, name=f"qr-decoder-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, frame_id, frame, wait=False, moving=True):
+        """Передает кадр на распознавание; кадр не должен изменяться после передачи.
+
+        При wait=True ждет, пока предыдущий кадр возьмут в работу, и не заменяет его.
+        moving - было ли в кадре движение: только такие кадры при двухэтапном
+        распознавании без найденного кандидата распознаются целиком.
+        """
+        with self.condition:
+            if wait:
+                self.condition.wait_for(lambda: self.pending is None or not self.running)
+            if self.pending is not None:
+                self.replaced += 1
+            self.pending = (frame_id, frame, moving)
+            self.submitted += 1
+            self.condition.notify()
+
+    def poll(self):
+        """Забирает последний результат распознавания (или None)"""
+        with self.condition:
+            result, self.result = self.result, None
+            return result
+
+    def wait_idle(self, timeout=None):
+        """Ждет, пока все переданные кадры будут распознаны"""
+        with self.condition:
+            return self.condition.wait_for(lambda: self.pending is None and self.busy == 0, timeout)
+
+    def clear(self):
+        """Сбрасывает ожидающий кадр и непрочитанный результат"""
+        with self.condition:
+            self.pending = None
+            self.result = None
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join(timeout=2.0)
+
+    def run(self):
+        detector = cv2.QRCodeDetector()
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending is not None or not self.running)
+                if not self.running:
+                    return
+                frame_id, frame, moving = self.pending
+                self.pending = None
+                self.busy += 1
+                self.condition.notify_all()
+
+            data, points = self.decode(detector, frame, moving)
+            if self.on_result is not None:
+                self.on_result(frame_id, data, points)
+
+            with self.condition:
+                self.decoded += 1
+                self.busy -= 1
+                if points is not None:
+                    self.last_candidate_time = time.time()
+                if data and (self.result is None or frame_id > self.result.frame_id):
+                    self.result = QRResult(frame_id, data, points, time.time())
+                self.condition.notify_all()
+
+    def decode(self, detector, frame, moving=True):
+        """Распознает один кадр детектором текущего потока"""
+        if self.mode == "two_stage":
+            return decode_qr_two_stage(frame, detector, full_fallback=FULL_FRAME_FALLBACK and moving)
+        return decode_qr(frame, detector)
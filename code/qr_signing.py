@@ -0,0 +1,123 @@
+# qr_signing.py - Подписанные данные QR-кода пропуска
+import base64
+import datetime
+import hashlib
+import hmac
+import os
+import secrets
+
+# Кодировать в QR-код подписанные данные (ID, срок действия, признак временного пропуска)
+# вместо одного ID. Считыватель принимает оба формата.
+SIGNED_QR_ENABLED = False
+SIGNING_KEY_FILE = "qr_signing.key"  # Ключ в папке database; копируется на все считыватели
+SIGNING_KEY_SIZE = 32
+SIGNATURE_SIZE = 16  # Сколько байт HMAC-SHA256 хранится в QR-коде
+
+# Формат: U1.<ID>.<ГГГГММДД или ->.<0|1>.<подпись base32>
+# Все символы входят в алфавитно-цифровой режим QR, поэтому код остается компактным
+PAYLOAD_PREFIX = "U1"
+PAYLOAD_SEPARATOR = "."
+NO_EXPIRY_MARK = "-"
+SIGNATURE_ALPHABET = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZ234567")  # Символы base32
+# Форматы срока действия в записях: ГГГГ-ММ-ДД и ДД.ММ.ГГГГ из ранних версий базы
+EXPIRY_DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y")
+
+
+def signing_key_path(database_dir):
+    """Путь к файлу ключа подписи"""
+    return os.path.join(database_dir, SIGNING_KEY_FILE)
+
+
+def load_signing_key(database_dir, create=False):
+    """Читает ключ подписи из папки базы; при create=True создает его, если файла нет.
+
+    Возвращает ключ (bytes) или None, если ключа нет или он поврежден.
+    """
+    path = signing_key_path(database_dir)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return bytes.fromhex(f.read().strip())
+    except FileNotFoundError:
+        if not create:
+            return None
+    except (OSError, ValueError) as e:
+        print(f"Ошибка чтения ключа подписи QR {path}: {e}")
+        return None
+
+    key = secrets.token_bytes(SIGNING_KEY_SIZE)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(key.hex())
+    print(f"Создан ключ подписи QR-кодов: {path}")
+    return key
+
+
+def compute_signature(key, body):
+    """Усеченная подпись HMAC-SHA256 в base32 без выравнивания"""
+    digest = hmac.new(key, body.encode("utf-8"), hashlib.sha256).digest()[:SIGNATURE_SIZE]
+    return base64.b32encode(digest).decode("ascii").rstrip("=")
+
+
+def format_expiry(expiration_date):
+    """Срок действия для подписанных данных: ГГГГММДД или NO_EXPIRY_MARK.
+
+    Принимает дату или строку в одном из EXPIRY_DATE_FORMATS; другой текст
+    в данные QR-кода не попадает - возбуждается ValueError.
+    """
+    if not expiration_date:
+        return NO_EXPIRY_MARK
+    if isinstance(expiration_date, datetime.date):
+        return expiration_date.strftime("%Y%m%d")
+    for date_format in EXPIRY_DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(str(expiration_date).strip(), date_format).strftime("%Y%m%d")
+        except ValueError:
+            continue
+    raise ValueError(f"Некорректный срок действия пропуска: {expiration_date}")
+
+
+def sign_payload(key, user_id, expiration_date=None, is_temporary=False):
+    """Формирует подписанные данные QR-кода; expiration_date - дата, строка (см. format_expiry) или None"""
+    expiry = format_expiry(expiration_date)
+    body = PAYLOAD_SEPARATOR.join((PAYLOAD_PREFIX, user_id, expiry, "1" if is_temporary else "0"))
+    return body + PAYLOAD_SEPARATOR + compute_signature(key, body)
+
+
+def is_signed_payload(payload):
+    """Проверяет, что QR-код содержит данные в подписанном формате"""
+    return payload.startswith(PAYLOAD_PREFIX + PAYLOAD_SEPARATOR)
+
+
+def verify_payload(key, payload):
+    """Проверяет подпись и разбирает данные QR-кода.
+
+    Возвращает словарь с полями ID, expiration_date (date или None) и is_temporary
+    либо None, если формат или подпись неверны. Данные QR-кода приходят с камеры
+    и могут быть любыми, поэтому ошибка разбора тоже дает None.
+    """
+    try:
+        body, _, signature = payload.rpartition(PAYLOAD_SEPARATOR)
+        parts = body.split(PAYLOAD_SEPARATOR)
+        if len(parts) != 4 or parts[0] != PAYLOAD_PREFIX:
+            return None
+        expected = compute_signature(key, body)
+        if len(signature) != len(expected) or not SIGNATURE_ALPHABET.issuperset(signature):
+            return None
+        # compare_digest не принимает строки с не-ASCII символами, поэтому сравниваются байты
+        if not hmac.compare_digest(signature.encode("ascii"), expected.encode("ascii")):
+            return None
+    except (ValueError, UnicodeError):
+        return None
+
+    _, user_id, expiry, temporary = parts
+    expiration_date = None
+    if expiry != NO_EXPIRY_MARK:
+        try:
+            expiration_date = datetime.datetime.strptime(expiry, "%Y%m%d").date()
+        except ValueError:
+            return None
+    return {
+        'ID': user_id,
+        'expiration_date': expiration_date,
+        'is_temporary': temporary == "1",
+    }
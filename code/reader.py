@@ -1,73 +1,115 @@
 import cv2
 import os
 import datetime
-import yaml
 import time
 import threading
-from openpyxl import Workbook, load_workbook
-from openpyxl.styles import PatternFill, Font, Alignment
-from openpyxl.utils import get_column_letter
+import select
+import ctypes
+import ctypes.util
+import argparse
+import json
+import multiprocessing
+import queue
+import signal
+from access_log import create_default_pipeline, make_access_event, export_report
+from profile_store import open_profile_store
+from qr_signing import load_signing_key, is_signed_payload, verify_payload
+from qr_pipeline import (FrameGrabber, QRDecodeStage, MotionGate, draw_qr_bbox, iter_replay_frames,
+                        RESULT_DISPLAY_TIME, MOTION_GATE_ENABLED)
 
 # Конфигурация путей
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 BASE_DIR = os.path.dirname(SCRIPT_DIR)
-DB_PATH = os.path.join(BASE_DIR, "database", "data_user.md")
+DB_DIR = os.path.join(BASE_DIR, "database")
 LOG_DIR = os.path.join(BASE_DIR, "database", "log_kkp")
 
 # Настройки сканирования
-SCAN_COOLDOWN = 5  # Задержка между сканированиями в секундах
-SCAN_TIMEOUT = 10  # Время ожидания перед следующим сканированием после успешного
-DB_RELOAD_INTERVAL = 30  # Интервал перезагрузки базы данных в секундах
+SCAN_DEBOUNCE_TTL = 10  # Сколько секунд после последнего считывания повтор того же пропуска игнорируется
+DEBOUNCE_PURGE_SIZE = 256  # Размер кэша повторов, при котором из него удаляются устаревшие ID
+RESULT_SHOW_TIME = 3  # Сколько секунд на экране показывается последнее решение
+DB_RELOAD_INTERVAL = 30  # Максимальный интервал между проверками базы при наличии уведомлений ОС
+DB_POLL_INTERVAL = 1  # Интервал опроса файлов базы, если уведомления ОС недоступны
+
+# Несколько проходов: по процессу захвата и распознавания на каждую камеру
+CAMERA_INDEXES = []  # Например [0, 1]; пустой список - первая работающая камера в одном процессе
+AUTHORIZE_TIMEOUT = 2.0  # Сколько секунд процесс камеры ждет решения супервизора
+SUPERVISOR_STATUS_INTERVAL = 1.0  # Период обновления общих сведений о базе для процессов камер
+
+# Режим без окна: кадры не размечаются и не выводятся, состояние пишется в файл
+HEADLESS = False
+STATUS_DIR = LOG_DIR  # Папка файлов состояния reader_status*.json
+STATUS_WRITE_INTERVAL = 1.0  # Период обновления файла состояния в секундах
+
+SIGNED_QR_REQUIRED = False  # Отклонять QR-коды без подписи (см. qr_signing.py)
+
+ACCESS_WEBHOOK_URL = None  # Адрес для отправки событий доступа POST-запросом, например "http://127.0.0.1:8090/access"
+
+NO_EXPIRY = datetime.date.max.toordinal()  # Срок действия пропусков без даты окончания
+
+access_pipeline = None  # Конвейер событий доступа (см. get_access_pipeline)
 
 class DatabaseManager:
     """Менеджер базы данных с поддержкой авто-обновления"""
     
-    def __init__(self, db_path):
-        self.db_path = db_path
-        self.authorized_users = {}
+    def __init__(self, db_dir):
+        self.db_dir = db_dir
+        self.store = open_profile_store(db_dir)  # Общее с ProfileManager хранилище профилей
+        self.access_table = {}  # ID -> AccessRecord
+        self.today = 0  # Порядковый номер текущего дня (date.toordinal)
+        self.next_day_time = 0  # Время начала следующих суток
         self.last_reload_time = 0
-        self.db_mtime = 0  # Время последнего изменения файла
-        self.lock = threading.Lock()
+        self.db_version = None  # Версия базы при последней загрузке
+        self.db_cursor = None  # Позиция в хранилище, до которой изменения уже применены
+        self.lock = threading.Lock()  # Сериализует перезагрузки; чтение идет без блокировки
+        self.signing_key = load_signing_key(db_dir)  # Ключ проверки подписанных QR-кодов, читается один раз
         self.last_reload_message_time = 0  # Время последнего сообщения о перезагрузке
         self.reload_database()
     
     def reload_database(self, silent=False):
         """Перезагрузка базы данных с проверкой изменений"""
         try:
-            # Проверяем время изменения файла
-            if not os.path.exists(self.db_path):
+            # Проверяем, изменилась ли база
+            current_version = self.store.change_token()
+            if current_version is None:
                 if not silent:
-                    print(f"Ошибка: База данных не найдена по пути: {self.db_path}")
+                    print(f"Ошибка: База данных не найдена в папке: {self.db_dir}")
                 return False
             
-            current_mtime = os.path.getmtime(self.db_path)
-            if current_mtime <= self.db_mtime:
-                return False  # Файл не изменялся
+            if current_version == self.db_version:
+                return False  # База не изменялась
             
-            with open(self.db_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Разделяем YAML документы если их несколько
-            yaml_documents = content.split('---')
-            new_users = {}
-            
-            for doc in yaml_documents:
-                doc = doc.strip()
-                if doc:
-                    user_data = yaml.safe_load(doc)
-                    if user_data and 'ID' in user_data:
-                        user_id = user_data['ID']
-                        new_users[user_id] = user_data
-            
-            with self.lock:
-                self.authorized_users = new_users
-                self.db_mtime = current_mtime
-                self.last_reload_time = time.time()
+            # Сначала пробуем применить только дописанные изменения
+            delta = self.store.read_changes(self.db_cursor)
+            if delta is not None:
+                changes, cursor = delta
+                with self.lock:
+                    # Изменения применяются на месте: замена одного ключа словаря атомарна,
+                    # поэтому чтение без блокировки видит либо старую, либо новую запись
+                    for user_id, user_data in changes:
+                        if user_data is None:
+                            self.access_table.pop(user_id, None)
+                        else:
+                            self.access_table[user_id] = compile_access_record(user_data)
+                    self.db_version = current_version
+                    self.db_cursor = cursor
+                    self.last_reload_time = time.time()
+                message = f"База данных обновлена. Изменено записей: {len(changes)}"
+            else:
+                new_users = {}
+                for user_data in self.store.load():
+                    new_users[user_data['ID']] = compile_access_record(user_data)
+                
+                with self.lock:
+                    self.access_table = new_users
+                    self.db_version = current_version
+                    self.db_cursor = self.store.read_cursor
+                    self.last_reload_time = time.time()
+                message = f"База данных перезагружена. Загружено {len(new_users)} пользователей"
             
             # Выводим сообщение только если прошло достаточно времени с последнего сообщения
             current_time = time.time()
             if current_time - self.last_reload_message_time > 10:  # Не чаще чем раз в 10 секунд
-                print(f"База данных перезагружена. Загружено {len(new_users)} пользователей")
+                print(message)
                 self.last_reload_message_time = current_time
             return True
             
@@ -76,204 +118,196 @@ class DatabaseManager:
                 print(f"Ошибка перезагрузки базы данных: {e}")
             return False
     
-    def get_user(self, user_id):
-        """Получение данных пользователя по ID"""
-        with self.lock:
-            return self.authorized_users.get(user_id)
-    
     def get_user_count(self):
         """Получение количества пользователей в базе"""
-        with self.lock:
-            return len(self.authorized_users)
+        return len(self.access_table)
+    
+    def refresh_day(self, now):
+        """Смена суток: сроки действия сравниваются с номером нового дня"""
+        today = datetime.date.fromtimestamp(now)
+        self.today = today.toordinal()
+        self.next_day_time = time.mktime((today + datetime.timedelta(days=1)).timetuple())
     
-    def should_reload(self):
-        """Проверка необходимости перезагрузки базы данных"""
-        return time.time() - self.last_reload_time > DB_RELOAD_INTERVAL
+    def decide(self, user_id, now=None):
+        """Решение о доступе по ID: (данные пользователя или None, доступ разрешен, причина отказа).
+        
+        Записи скомпилированы при загрузке базы, поэтому решение - один поиск
+        в словаре и сравнение номера дня со сроком действия. Для подписанного
+        QR-кода, если база не загружена (файла нет или загрузка не удалась),
+        решение принимается по его данным.
+        """
+        if is_signed_payload(user_id):
+            claims = verify_payload(self.signing_key, user_id) if self.signing_key else None
+            if claims is None:
+                return None, False, "Недействительная подпись QR-кода"
+            user_id = claims['ID']
+            record = self.access_table.get(user_id)
+            if record is None and self.db_version is None:
+                record = compile_access_record(claims)
+        elif SIGNED_QR_REQUIRED:
+            return None, False, "QR-код без подписи"
+        else:
+            record = self.access_table.get(user_id)
+        if record is None:
+            return None, False, "Неизвестный ID"
+        
+        if now is None:
+            now = time.time()
+        if now >= self.next_day_time:
+            self.refresh_day(now)
+        if self.today > record.expiry:
+            return record.user_data, False, "Просроченный пропуск"
+        
+        if record.is_temporary:
+            print("Временный пропуск - требуется дополнительная проверка")
+            # Здесь можно добавить дополнительную логику для временных пропусков
+        return record.user_data, True, ""
 
-def check_access_permission(user_data):
-    """Проверка разрешения доступа на основе данных пользователя"""
-    if not user_data:
-        return False
+class InotifyWaiter:
+    """Ожидание изменений в папке через inotify (Linux)"""
+    
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    
+    def __init__(self, path):
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name:
+            raise OSError("libc не найдена")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify недоступен")
+        
+        self.fd = libc.inotify_init1(os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, "inotify_add_watch")
+    
+    def wait(self, timeout):
+        """Ждет событие не дольше timeout секунд; возвращает True, если оно было"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+    
+    def close(self):
+        os.close(self.fd)
+
+class DatabaseWatcher:
+    """Фоновый поток, перезагружающий базу при изменении файлов в папке database"""
+    
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="db-watcher", daemon=True)
+    
+    def start(self):
+        self.thread.start()
+    
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join(timeout=DB_POLL_INTERVAL * 2)
     
-    # Проверяем срок действия
-    if 'expiration_date' in user_data:
-        expiration = user_data['expiration_date']
-        current_date = datetime.datetime.now().date()
+    def run(self):
+        waiter = None
+        try:
+            waiter = InotifyWaiter(self.db_manager.db_dir)
+            print("Отслеживание базы данных: inotify")
+        except (OSError, AttributeError) as e:
+            print(f"Отслеживание базы данных: опрос каждые {DB_POLL_INTERVAL} с ({e})")
         
+        last_check_time = time.time()
         try:
-            # Если expiration уже является объектом date
-            if isinstance(expiration, datetime.date):
-                expiration_date = expiration
-            else:
-                # Если это строка, парсим ее
-                expiration_date = datetime.datetime.strptime(str(expiration), '%Y-%m-%d').date()
-            
-            if current_date > expiration_date:
-                print(f"Просроченный пропуск: {expiration_date}")
-                return False
-                
-        except (ValueError, TypeError) as e:
-            print(f"Ошибка проверки срока действия: {e}")
-            # В случае ошибки парсинга даты, разрешаем доступ для безопасности
-            return True
+            while not self.stop_event.is_set():
+                if waiter is not None:
+                    changed = waiter.wait(DB_POLL_INTERVAL)
+                    if not changed and time.time() - last_check_time < DB_RELOAD_INTERVAL:
+                        continue
+                elif self.stop_event.wait(DB_POLL_INTERVAL):
+                    break
+                # Проверка версии дешевая: полная загрузка идет только при реальных изменениях
+                last_check_time = time.time()
+                self.db_manager.reload_database(silent=True)
+        finally:
+            if waiter is not None:
+                waiter.close()
+
+def prepare_user_data(user_data):
+    """Приводит поля профиля из хранилища к типам, используемым при проверке доступа"""
+    expiration = user_data.get('expiration_date')
+    if isinstance(expiration, str):
+        try:
+            user_data['expiration_date'] = datetime.datetime.strptime(expiration, '%Y-%m-%d').date()
+        except ValueError:
+            pass  # Некорректная дата остается строкой и обрабатывается при проверке
     
-    # Проверяем временный пропуск
-    if user_data.get('is_temporary', False):
-        print("Временный пропуск - требуется дополнительная проверка")
-        # Здесь можно добавить дополнительную логику для временных пропусков
+    if 'is_temporary' in user_data:
+        user_data['is_temporary'] = str(user_data['is_temporary']).lower() == 'true'
     
-    return True
+    return user_data
 
-def create_excel_log_file(log_file):
-    """Создание нового Excel файла с заголовками"""
-    try:
-        workbook = Workbook()
-        worksheet = workbook.active
-        worksheet.title = "Лог доступа"
-        
-        # Заголовки колонок
-        headers = [
-            'Время', 
-            'ID', 
-            'ФИО', 
-            'Организация', 
-            'Отдел', 
-            'Срок действия', 
-            'Статус доступа', 
-            'Причина'
-        ]
-        
-        # Записываем заголовки
-        for col, header in enumerate(headers, 1):
-            cell = worksheet.cell(row=1, column=col, value=header)
-            cell.font = Font(bold=True)
-            cell.alignment = Alignment(horizontal='center')
-        
-        # Настраиваем ширину колонок
-        column_widths = {
-            'A': 20,  # Время
-            'B': 15,  # ID
-            'C': 30,  # ФИО
-            'D': 40,  # Организация
-            'E': 30,  # Отдел
-            'F': 15,  # Срок действия
-            'G': 20,  # Статус доступа
-            'H': 30   # Причина
-        }
-        
-        for col, width in column_widths.items():
-            worksheet.column_dimensions[col].width = width
-        
-        # Сохраняем файл
-        workbook.save(log_file)
-        print(f"Создан новый лог-файл: {log_file}")
-        return True
-    except Exception as e:
-        print(f"Ошибка создания Excel файла: {e}")
-        return False
+class AccessRecord:
+    """Запись таблицы решений: профиль, срок действия как номер дня и признак временного пропуска"""
+    
+    __slots__ = ('user_data', 'expiry', 'is_temporary')
+    
+    def __init__(self, user_data, expiry, is_temporary):
+        self.user_data = user_data
+        self.expiry = expiry
+        self.is_temporary = is_temporary
+
+def compile_access_record(user_data):
+    """Готовит профиль из хранилища к быстрым решениям о доступе"""
+    user_data = prepare_user_data(user_data)
+    expiration = user_data.get('expiration_date')
+    if isinstance(expiration, datetime.date):
+        expiry = expiration.toordinal()
+    else:
+        # Пропуск без срока или с некорректной датой не блокируется
+        expiry = NO_EXPIRY
+    return AccessRecord(user_data, expiry, bool(user_data.get('is_temporary', False)))
 
-def log_entry(user_data, access_granted, reason=""):
-    """Запись в лог-файл в формате Excel"""
+def get_access_pipeline():
+    """Возвращает конвейер событий доступа, запуская его потоки при первом вызове"""
+    global access_pipeline
+    if access_pipeline is None:
+        access_pipeline = create_default_pipeline(LOG_DIR, ACCESS_WEBHOOK_URL)
+    return access_pipeline
+
+def log_entry(user_data, access_granted, reason="", lane=None):
+    """Передача события доступа в конвейер (консоль, журнал, Excel - в фоновых потоках)"""
     try:
-        today = datetime.datetime.now().strftime("%Y-%m-%d")
-        log_file = os.path.join(LOG_DIR, f"log_{today}.xlsx")
-        
-        # Создаем папку для логов если её нет
-        os.makedirs(LOG_DIR, exist_ok=True)
-        
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        status = "ДОСТУП РАЗРЕШЕН" if access_granted else "ДОСТУП ЗАПРЕЩЕН"
-        
-        # Проверяем существование файла
-        if not os.path.exists(log_file):
-            if not create_excel_log_file(log_file):
-                return False
-        
-        # Загружаем существующий файл
-        workbook = load_workbook(log_file)
-        worksheet = workbook.active
-        
-        # Определяем следующую строку для записи
-        next_row = worksheet.max_row + 1
-        
-        # Подготавливаем данные для записи
-        if user_data:
-            # Форматируем дату для корректного отображения
-            expiration = user_data.get('expiration_date', 'Неизвестно')
-            if isinstance(expiration, datetime.date):
-                expiration = expiration.strftime('%Y-%m-%d')
-            
-            data = [
-                timestamp,
-                user_data.get('ID', 'Неизвестно'),
-                user_data.get('full_name', 'Неизвестно'),
-                user_data.get('organization', 'Неизвестно'),
-                user_data.get('department', 'Неизвестно'),
-                expiration,
-                status,
-                reason
-            ]
-        else:
-            data = [
-                timestamp,
-                'Неизвестно',
-                'Неизвестно',
-                'Неизвестно',
-                'Неизвестно',
-                'Неизвестно',
-                status,
-                reason
-            ]
-        
-        # Записываем данные в строку
-        for col, value in enumerate(data, 1):
-            worksheet.cell(row=next_row, column=col, value=value)
-        
-        # Применяем цветовое форматирование
-        if access_granted:
-            fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")  # Светло-зеленый
-        else:
-            fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")  # Светло-красный
-        
-        # Применяем цвет ко всей строке
-        for col in range(1, 9):  # Колонки от A до H
-            worksheet.cell(row=next_row, column=col).fill = fill
-        
-        # Сохраняем файл
-        workbook.save(log_file)
+        if not get_access_pipeline().submit(make_access_event(user_data, access_granted, reason, lane)):
+            print("Внимание: очередь событий доступа переполнена, событие отброшено частью приемников")
         return True
-        
     except Exception as e:
         print(f"Ошибка записи в лог: {e}")
         return False
 
-def process_qr_code(frame):
-    """Декодирование QR-кода с использованием OpenCV"""
-    try:
-        # Инициализируем детектор QR-кодов OpenCV
-        qr_detector = cv2.QRCodeDetector()
-        
-        # Пытаемся обнаружить и декодировать QR-код
-        data, bbox, _ = qr_detector.detectAndDecode(frame)
-        
-        if data and bbox is not None:
-            # Визуализируем QR-код на кадре
-            if len(bbox) > 0:
-                bbox = bbox.astype(int)
-                n = len(bbox)
-                for i in range(n):
-                    cv2.line(frame, tuple(bbox[i][0]), tuple(bbox[(i+1) % n][0]), (0, 255, 0), 3)
-            
-            return data
-        
-        return None
-    except Exception as e:
-        return None
+def print_pipeline_metrics(pipeline):
+    """Вывод метрик очередей конвейера событий"""
+    for name, metrics in pipeline.metrics().items():
+        print(f"  {name}: обработано {metrics['processed']}, отброшено {metrics['dropped']}, "
+              f"ошибок {metrics['errors']}, макс. очередь {metrics['max_depth']}, "
+              f"задержка {metrics['last_latency_ms']} мс")
 
-def setup_camera():
-    """Настройка и подключение к камере"""
-    # Пробуем разные индексы камеры
-    for i in range(3):
+def setup_camera(camera_index=None):
+    """Настройка и подключение к камере (по умолчанию - первой работающей из индексов 0-2)"""
+    # Пробуем разные индексы камеры, если конкретная камера не задана
+    indexes = range(3) if camera_index is None else [camera_index]
+    for i in indexes:
         cap = cv2.VideoCapture(i)
         
         # Настройки камеры для лучшего распознавания QR
@@ -294,7 +328,10 @@ def setup_camera():
             else:
                 cap.release()
     
-    print("Ошибка: Не удалось подключиться ни к одной камере!")
+    if camera_index is None:
+        print("Ошибка: Не удалось подключиться ни к одной камере!")
+    else:
+        print(f"Ошибка: Не удалось подключиться к камере {camera_index}!")
     return None
 
 def safe_str(value, default="N/A"):
@@ -303,7 +340,7 @@ def safe_str(value, default="N/A"):
         return default
     return str(value)
 
-def display_user_info(frame, user_data, access_granted, countdown=None, db_reload_countdown=None):
+def display_user_info(frame, user_data, access_granted, db_updated_at=None):
     """Отображение информации о пользователе на кадре"""
     color = (0, 255, 0) if access_granted else (0, 0, 255)
     status_text = "ACCESS GRANTED" if access_granted else "ACCESS DENIED"
@@ -312,14 +349,9 @@ def display_user_info(frame, user_data, access_granted, countdown=None, db_reloa
     cv2.putText(frame, status_text, (50, 80), 
                cv2.FONT_HERSHEY_SIMPLEX, 1.5, color, 3)
     
-    # Отображение обратного отсчета если есть
-    if countdown is not None:
-        cv2.putText(frame, f"Next scan in: {countdown}s", (50, 250), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-    
-    # Отображение времени до обновления БД
-    if db_reload_countdown is not None:
-        cv2.putText(frame, f"DB reload in: {db_reload_countdown}s", (50, 280), 
+    # Отображение времени последнего обновления БД
+    if db_updated_at is not None:
+        cv2.putText(frame, f"DB updated: {db_updated_at}", (50, 280), 
                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200, 200, 0), 1)
     
     if user_data:
@@ -354,149 +386,445 @@ def display_user_info(frame, user_data, access_granted, countdown=None, db_reloa
         cv2.putText(frame, f"Expires: {expiration}", (50, 210), 
                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, exp_color, 1)
 
-def main():
-    # Инициализация менеджера базы данных
-    db_manager = DatabaseManager(DB_PATH)
+def decide_access(db_manager, qr_data):
+    """Решение о доступе по считанному ID.
     
-    # Инициализация камеры
-    cap = setup_camera()
-    if cap is None:
-        return
+    Возвращает (данные пользователя или None, доступ разрешен, причина отказа).
+    """
+    return db_manager.decide(qr_data)
 
-    print("Система контроля доступа запущена...")
-    print("Наведите камеру на QR-код")
-    print("Для выхода нажмите 'q'")
-
-    # Состояние системы
-    scan_state = "READY"  # READY, PROCESSING, COOLDOWN
-    last_scanned_id = None
-    scan_start_time = 0
-    cooldown_end_time = 0
-    current_user_data = None
-    current_access_granted = False
-    
-    # Для отслеживания обновления БД
-    last_db_reload_time = time.time()
-    db_reload_notified = False  # Флаг для отслеживания уведомления об обновлении
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            print("Ошибка: Не удалось получить кадр с камеры!")
-            # Пытаемся переподключиться к камере
-            cap.release()
-            time.sleep(2)
-            cap = setup_camera()
-            if cap is None:
-                break
-            continue
+def authorize_scan(db_manager, qr_data, lane=None):
+    """Решение о доступе с записью события в журнал; возвращает (данные пользователя, доступ разрешен)"""
+    user_data, access_granted, reason = decide_access(db_manager, qr_data)
+    log_entry(user_data, access_granted, reason, lane)
+    return user_data, access_granted
 
-        current_time = time.time()
-        
-        # Проверка необходимости обновления базы данных
-        if db_manager.should_reload():
-            if not db_reload_notified:
-                print("Обнаружена необходимость обновления базы данных...")
-                db_reload_notified = True
-            
-            db_manager.reload_database(silent=True)  # Тихая перезагрузка без лишних сообщений
-            last_db_reload_time = current_time
-        else:
-            db_reload_notified = False  # Сбрасываем флаг, когда обновление не требуется
-        
-        # Расчет времени до следующего обновления БД
-        db_reload_countdown = max(0, int(DB_RELOAD_INTERVAL - (current_time - db_manager.last_reload_time)))
-        
-        # Обработка состояний системы
-        if scan_state == "READY":
-            # Декодирование QR-кода
-            qr_data = process_qr_code(frame)
-            
-            if qr_data:
-                scan_state = "PROCESSING"
-                scan_start_time = current_time
-                last_scanned_id = qr_data
-                
-                # Поиск пользователя в базе данных (используем актуальные данные)
-                current_user_data = db_manager.get_user(qr_data)
-                
-                if current_user_data:
-                    # Проверка дополнительных условий доступа
-                    current_access_granted = check_access_permission(current_user_data)
-                    
-                    if current_access_granted:
-                        print(f"✓ ДОСТУП РАЗРЕШЕН - {current_user_data.get('full_name', 'Unknown')}")
-                        log_entry(current_user_data, True)
-                    else:
-                        # Определяем причину отказа
-                        expiration = current_user_data.get('expiration_date')
-                        if expiration:
-                            if isinstance(expiration, datetime.date):
-                                current_date = datetime.datetime.now().date()
-                                if current_date > expiration:
-                                    reason = "Просроченный пропуск"
-                                else:
-                                    reason = "Доступ ограничен"
-                            else:
-                                reason = "Проблема с данными пропуска"
-                        else:
-                            reason = "Доступ ограничен"
-                        
-                        print(f"✗ ДОСТУП ЗАПРЕЩЕН - {reason}")
-                        log_entry(current_user_data, False, reason)
-                else:
-                    print("✗ ДОСТУП ЗАПРЕЩЕН - Неавторизованный ID")
-                    log_entry(None, False, "Неизвестный ID")
-                    current_user_data = None
-                    current_access_granted = False
-        
-        elif scan_state == "PROCESSING":
-            # Показываем результат сканирования в течение SCAN_COOLDOWN секунд
-            if current_time - scan_start_time >= SCAN_COOLDOWN:
-                scan_state = "COOLDOWN"
-                cooldown_end_time = current_time + SCAN_TIMEOUT
-        
-        elif scan_state == "COOLDOWN":
-            # Ожидание перед следующим сканированием
-            if current_time >= cooldown_end_time:
-                scan_state = "READY"
-                last_scanned_id = None
-                current_user_data = None
-                print("Готов к сканированию...")
-
-        # Отображение информации в зависимости от состояния
-        if scan_state == "READY":
+class ScanDebounce:
+    """Кэш повторных считываний: один и тот же ID пропускается не чаще раза в ttl секунд.
+    
+    Пока пропуск остается в кадре, срок подавления продлевается; другой пропуск
+    проходит сразу.
+    """
+    
+    def __init__(self, ttl=SCAN_DEBOUNCE_TTL):
+        self.ttl = ttl
+        self.expires = {}  # ID -> время окончания подавления
+        self.suppressed = 0
+    
+    def accept(self, user_id, now):
+        """Возвращает True, если считывание нужно обработать, и False для повтора"""
+        expires = self.expires.get(user_id)
+        self.expires[user_id] = now + self.ttl
+        if expires is not None and now < expires:
+            self.suppressed += 1
+            return False
+        if len(self.expires) > DEBOUNCE_PURGE_SIZE:
+            self.expires = {key: value for key, value in self.expires.items() if value > now}
+        return True
+
+class LaneState:
+    """Состояние одного прохода: готовность (READY) или показ последнего решения (RESULT).
+    
+    Сканирование не блокируется на время показа: повторы того же пропуска
+    отсекает ScanDebounce, а новый пропуск сразу заменяет показанный результат.
+    """
+    
+    STATE_COLORS = {"READY": (0, 255, 0), "RESULT": (0, 255, 255)}
+    
+    def __init__(self, name):
+        self.name = name
+        self.scan_state = "READY"
+        self.debounce = ScanDebounce()
+        self.last_scanned_id = None
+        self.scan_start_time = 0
+        self.user_data = None
+        self.access_granted = False
+        self.last_decision = None  # Последнее решение для файла состояния
+    
+    def start_scan(self, qr_data, user_data, access_granted, now):
+        """Показ решения по считанному коду"""
+        self.scan_state = "RESULT"
+        self.scan_start_time = now
+        self.last_scanned_id = qr_data
+        self.user_data = user_data
+        self.access_granted = access_granted
+        self.last_decision = {
+            'ID': user_data.get('ID', qr_data) if user_data else qr_data,
+            'granted': access_granted,
+            'time': datetime.datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S"),
+        }
+    
+    def update(self, now):
+        """Возврат к приглашению после RESULT_SHOW_TIME секунд показа решения"""
+        if self.scan_state == "RESULT" and now - self.scan_start_time >= RESULT_SHOW_TIME:
+            self.scan_state = "READY"
+            self.last_scanned_id = None
+            self.user_data = None
+    
+    def draw(self, frame, now, db_updated_at, user_count):
+        """Отображение информации в зависимости от состояния"""
+        if self.scan_state == "READY":
             cv2.putText(frame, "Scan QR Code", (50, 100), 
                        cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-            display_user_info(frame, None, False, None, db_reload_countdown)
-        elif scan_state == "PROCESSING":
-            remaining = max(0, SCAN_COOLDOWN - (current_time - scan_start_time))
-            display_user_info(frame, current_user_data, current_access_granted, int(remaining), db_reload_countdown)
-        elif scan_state == "COOLDOWN":
-            remaining = max(0, cooldown_end_time - current_time)
-            display_user_info(frame, current_user_data, current_access_granted, int(remaining), db_reload_countdown)
-            cv2.putText(frame, "Please remove QR code", (50, 310), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-
-        # Отображение состояния системы
-        state_colors = {"READY": (0, 255, 0), "PROCESSING": (0, 255, 255), "COOLDOWN": (255, 255, 0)}
-        cv2.putText(frame, f"State: {scan_state}", (10, 30), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, state_colors.get(scan_state, (255, 255, 255)), 2)
+            display_user_info(frame, None, False, db_updated_at)
+        else:
+            display_user_info(frame, self.user_data, self.access_granted, db_updated_at)
+        
+        # Отображение состояния прохода
+        cv2.putText(frame, f"State: {self.scan_state}", (10, 30), 
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, self.STATE_COLORS.get(self.scan_state, (255, 255, 255)), 2)
         
         # Отображение информации о базе данных
-        user_count = db_manager.get_user_count()
         cv2.putText(frame, f"Users in DB: {user_count}", (10, 60), 
                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200, 200, 200), 1)
 
-        cv2.imshow('u.p.i.c reader', frame)
+class LaneStatusFile:
+    """Файл состояния прохода (JSON), обновляемый не чаще раза в interval секунд.
+    
+    Позволяет наблюдать за считывателем в режиме без окна: состояние, частота
+    кадров, последнее решение, сведения о базе и счетчики распознавания.
+    """
+    
+    def __init__(self, path, interval=STATUS_WRITE_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.last_write_time = 0
+        self.frames = 0  # Кадры с момента последней записи
+        self.error_reported = False
+    
+    def tick(self, now, lane, decoder, motion_gate, last_reload_time, user_count):
+        """Учитывает кадр и при необходимости перезаписывает файл состояния"""
+        self.frames += 1
+        if now - self.last_write_time < self.interval:
+            return
+        fps = self.frames / (now - self.last_write_time) if self.last_write_time else None
+        status = {
+            'lane': lane.name,
+            'state': lane.scan_state,
+            'updated_at': datetime.datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S"),
+            'fps': round(fps, 1) if fps is not None else None,
+            'users_in_db': user_count,
+            'db_updated_at': datetime.datetime.fromtimestamp(last_reload_time).strftime("%Y-%m-%d %H:%M:%S"),
+            'last_decision': lane.last_decision,
+            'repeats_suppressed': lane.debounce.suppressed,
+            'decoder': {'submitted': decoder.submitted, 'replaced': decoder.replaced, 'decoded': decoder.decoded},
+        }
+        if motion_gate is not None:
+            status['motion_gate'] = {'passed': motion_gate.passed, 'skipped': motion_gate.skipped}
+        self.last_write_time = now
+        self.frames = 0
+        
+        temp_file = self.path + ".tmp"
+        try:
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump(status, f, ensure_ascii=False, indent=2)
+            os.replace(temp_file, self.path)
+        except OSError as e:
+            if not self.error_reported:
+                print(f"Ошибка записи файла состояния {self.path}: {e}")
+                self.error_reported = True
+
+def status_file_path(camera_index=None):
+    """Путь к файлу состояния прохода"""
+    name = "reader_status.json" if camera_index is None else f"reader_status_camera_{camera_index}.json"
+    return os.path.join(STATUS_DIR, name)
+
+def run_lane(cap, lane, authorize, db_status, camera_index=None, window_name='u.p.i.c reader',
+             stop_event=None, headless=HEADLESS):
+    """Цикл одного прохода: захват, распознавание, решение о доступе и отображение.
+    
+    authorize(qr_data) возвращает (данные пользователя, доступ разрешен),
+    db_status() - (время последней загрузки базы, число пользователей).
+    В режиме headless кадры не размечаются и не выводятся в окно.
+    """
+    # Захват и распознавание работают в отдельных потоках
+    grabber = FrameGrabber(cap)
+    decoder = QRDecodeStage()
+    motion_gate = MotionGate() if MOTION_GATE_ENABLED else None
+    status_file = LaneStatusFile(status_file_path(camera_index))
+    frame_id = 0
+    last_qr_result = None  # Для отображения рамки последнего найденного QR-кода
+
+    try:
+        while stop_event is None or not stop_event.is_set():
+            ret, frame, frame_id = grabber.read(frame_id)
+            if not ret:
+                print(f"{lane.name}: Ошибка: Не удалось получить кадр с камеры!")
+                # Пытаемся переподключиться к камере
+                grabber.stop()
+                cap.release()
+                time.sleep(2)
+                cap = setup_camera(camera_index)
+                if cap is None:
+                    break
+                grabber = FrameGrabber(cap)
+                frame_id = 0
+                decoder.clear()  # Номера кадров начинаются заново
+                continue
+
+            current_time = time.time()
+            
+            # База обновляется в фоне (DatabaseWatcher или супервизор проходов)
+            last_reload_time, user_count = db_status()
+            
+            # Кадр уходит в потоки распознавания (если сцена изменилась); берем последний готовый результат.
+            # Без окна кадр не размечается, поэтому копия для декодера не нужна
+            if motion_gate is None or motion_gate.should_decode(frame, current_time, decoder.last_candidate_time):
+                decoder.submit(frame_id, frame if headless else frame.copy(),
+                               moving=motion_gate is None or motion_gate.moving)
+            qr_result = decoder.poll()
+            if qr_result:
+                last_qr_result = qr_result
+                # Повторные считывания того же пропуска отсекаются, другой пропуск обрабатывается сразу
+                if lane.debounce.accept(qr_result.data, current_time):
+                    user_data, access_granted = authorize(qr_result.data)
+                    lane.start_scan(qr_result.data, user_data, access_granted, current_time)
+            lane.update(current_time)
+
+            status_file.tick(current_time, lane, decoder, motion_gate, last_reload_time, user_count)
+            if headless:
+                continue
+
+            # Рамка найденного QR-кода
+            if last_qr_result and current_time - last_qr_result.decoded_at < RESULT_DISPLAY_TIME:
+                draw_qr_bbox(frame, last_qr_result.points)
+            
+            db_updated_at = time.strftime("%H:%M:%S", time.localtime(last_reload_time))
+            lane.draw(frame, current_time, db_updated_at, user_count)
+            cv2.imshow(window_name, frame)
+
+            # Выход по нажатию 'q'
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+    finally:
+        decoder.stop()
+        if cap is not None:
+            grabber.stop()
+            cap.release()
+        if not headless:
+            cv2.destroyAllWindows()
 
-        # Выход по нажатию 'q'
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+def close_access_pipeline():
+    """Дописывает очереди конвейера событий, обновляет Excel-отчет за день и выводит метрики"""
+    if access_pipeline is not None:
+        access_pipeline.close()
+        print("Конвейер событий доступа:")
+        print_pipeline_metrics(access_pipeline)
 
-    cap.release()
-    cv2.destroyAllWindows()
+def main(camera_index=None, headless=HEADLESS):
+    # Инициализация менеджера базы данных
+    db_manager = DatabaseManager(DB_DIR)
+    db_watcher = DatabaseWatcher(db_manager)
+    db_watcher.start()
+    
+    # Инициализация камеры
+    cap = setup_camera(camera_index)
+    if cap is None:
+        db_watcher.stop()
+        return
+
+    print("Система контроля доступа запущена...")
+    print("Наведите камеру на QR-код")
+    if headless:
+        print(f"Режим без окна, состояние: {status_file_path(camera_index)}")
+        print("Для выхода нажмите Ctrl+C")
+    else:
+        print("Для выхода нажмите 'q'")
+
+    try:
+        run_lane(cap, LaneState("Проход"),
+                 lambda qr_data: authorize_scan(db_manager, qr_data),
+                 lambda: (db_manager.last_reload_time, db_manager.get_user_count()),
+                 camera_index, headless=headless)
+    except KeyboardInterrupt:
+        pass
+
+    db_watcher.stop()
+    close_access_pipeline()
     print("Система остановлена")
 
+def lane_worker(camera_index, requests, replies, last_reload_time, user_count, stop_event, headless=HEADLESS):
+    """Процесс одной камеры: захват и распознавание; решение о доступе принимает супервизор"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C обрабатывает супервизор
+    lane = LaneState(f"Камера {camera_index}")
+    cap = setup_camera(camera_index)
+    if cap is None:
+        return
+    
+    request_id = 0
+    
+    def authorize(qr_data):
+        nonlocal request_id
+        request_id += 1
+        requests.put((camera_index, request_id, qr_data))
+        deadline = time.time() + AUTHORIZE_TIMEOUT
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                reply_id, user_data, access_granted = replies.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if reply_id == request_id:
+                return user_data, access_granted
+            # Запоздалый ответ на запрос, по которому ожидание уже истекло
+        print(f"{lane.name}: супервизор не ответил за {AUTHORIZE_TIMEOUT} с, доступ запрещен")
+        return None, False
+    
+    run_lane(cap, lane, authorize,
+             lambda: (last_reload_time.value, user_count.value),
+             camera_index, f"u.p.i.c reader - camera {camera_index}", stop_event, headless)
+    print(f"{lane.name}: проход остановлен")
+
+def run_supervisor(camera_indexes, headless=HEADLESS):
+    """Супервизор проходов: по процессу захвата и распознавания на камеру.
+    
+    Таблица пользователей и конвейер журнала доступа существуют в одном
+    экземпляре в процессе супервизора; процессы камер присылают считанные
+    ID и получают готовое решение.
+    """
+    db_manager = DatabaseManager(DB_DIR)
+    db_watcher = DatabaseWatcher(db_manager)
+    db_watcher.start()
+    get_access_pipeline()
+    
+    context = multiprocessing.get_context("spawn")
+    requests = context.Queue()
+    stop_event = context.Event()
+    last_reload_time = context.Value('d', db_manager.last_reload_time, lock=False)
+    user_count = context.Value('i', db_manager.get_user_count(), lock=False)
+    
+    lanes = {}
+    for camera_index in camera_indexes:
+        replies = context.Queue()
+        process = context.Process(target=lane_worker, name=f"lane-{camera_index}", daemon=True,
+                                  args=(camera_index, requests, replies, last_reload_time, user_count, stop_event, headless))
+        process.start()
+        lanes[camera_index] = (process, replies)
+    
+    print(f"Супервизор проходов запущен, камеры: {', '.join(str(i) for i in camera_indexes)}")
+    if headless:
+        print(f"Режим без окна, состояние проходов: {STATUS_DIR}")
+        print("Для остановки всех проходов нажмите Ctrl+C")
+    else:
+        print("Для выхода из прохода нажмите 'q' в его окне, для остановки всех проходов - Ctrl+C")
+    
+    try:
+        while any(process.is_alive() for process, _ in lanes.values()):
+            try:
+                camera_index, request_id, qr_data = requests.get(timeout=SUPERVISOR_STATUS_INTERVAL)
+            except queue.Empty:
+                pass
+            else:
+                user_data, access_granted = authorize_scan(db_manager, qr_data, f"Камера {camera_index}")
+                lanes[camera_index][1].put((request_id, user_data, access_granted))
+            last_reload_time.value = db_manager.last_reload_time
+            user_count.value = db_manager.get_user_count()
+    except KeyboardInterrupt:
+        pass
+    
+    stop_event.set()
+    for process, _ in lanes.values():
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+    db_watcher.stop()
+    close_access_pipeline()
+    print("Система остановлена")
+
+def percentile(values, fraction):
+    """Перцентиль отсортированного списка (ближайший ранг)"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+def run_replay(source, repeat=1):
+    """Прогон видео или папки кадров через распознавание и решение о доступе без окна.
+    
+    Кадры подаются с максимальной скоростью, без замены необработанных кадров,
+    события в журнал доступа не пишутся. Фильтр движения работает по времени
+    записи (номер кадра и частота кадров), а не по часам, и не удерживает
+    распознавание после найденного кандидата: это зависит от скорости
+    распознавания, и результат прогона перестал бы повторяться. Выводит кадры/с,
+    долю успешных распознаваний и задержку от получения кадра до решения (p50/p99).
+    """
+    db_manager = DatabaseManager(DB_DIR)
+    results = queue.Queue()
+    decoder = QRDecodeStage(on_result=lambda frame_id, data, points: results.put((frame_id, data)))
+    motion_gate = MotionGate() if MOTION_GATE_ENABLED else None
+    frame_times = {}  # Номер кадра -> время получения
+    latencies = []
+    stats = {'frames': 0, 'submitted': 0, 'decoded': 0, 'granted': 0, 'denied': 0}
+    
+    def collect_results():
+        while True:
+            try:
+                frame_id, data = results.get_nowait()
+            except queue.Empty:
+                return
+            received_at = frame_times.pop(frame_id)
+            if not data:
+                continue
+            stats['decoded'] += 1
+            _, access_granted, _ = decide_access(db_manager, data)
+            latencies.append(time.perf_counter() - received_at)
+            stats['granted' if access_granted else 'denied'] += 1
+    
+    print(f"Воспроизведение: {source} (проходов: {repeat})")
+    start_time = time.perf_counter()
+    replay_clock = 0.0  # Время записи текущего кадра, секунды
+    try:
+        for _ in range(repeat):
+            for frame, interval in iter_replay_frames(source):
+                stats['frames'] += 1
+                frame_id = stats['frames']
+                if motion_gate is None or motion_gate.should_decode(frame, replay_clock, float('-inf')):
+                    frame_times[frame_id] = time.perf_counter()
+                    decoder.submit(frame_id, frame, wait=True, moving=motion_gate is None or motion_gate.moving)
+                    stats['submitted'] += 1
+                replay_clock += interval
+                collect_results()
+        decoder.wait_idle()
+        collect_results()
+    finally:
+        decoder.stop()
+    elapsed = time.perf_counter() - start_time
+    
+    frames = stats['frames']
+    submitted = stats['submitted']
+    latencies.sort()
+    print(f"Кадров: {frames} за {elapsed:.2f} с ({frames / elapsed if elapsed > 0 else 0:.1f} кадр/с)")
+    print(f"Передано на распознавание: {submitted}, пропущено фильтром движения: {frames - submitted}")
+    print(f"Успешно распознано: {stats['decoded']} ({100.0 * stats['decoded'] / submitted if submitted else 0:.1f}% "
+          f"переданных, {100.0 * stats['decoded'] / frames if frames else 0:.1f}% всех кадров)")
+    print(f"Решений: разрешено {stats['granted']}, запрещено {stats['denied']}")
+    print(f"Задержка решения: p50 {percentile(latencies, 0.5) * 1000:.1f} мс, "
+          f"p99 {percentile(latencies, 0.99) * 1000:.1f} мс")
+    return stats
+
+def parse_args():
+    """Разбор аргументов командной строки"""
+    parser = argparse.ArgumentParser(description="u.p.i.c - считыватель пропусков")
+    parser.add_argument("--report", nargs="?", const="", metavar="ГГГГ-ММ-ДД",
+                        help="построить Excel-отчет из журнала доступа за день (по умолчанию сегодня) и выйти")
+    parser.add_argument("--cameras", nargs="+", type=int, default=CAMERA_INDEXES, metavar="ИНДЕКС",
+                        help="индексы камер; для нескольких камер запускается супервизор с процессом на каждую")
+    parser.add_argument("--headless", action="store_true", default=HEADLESS,
+                        help="работать без окна и разметки кадров; состояние пишется в reader_status*.json")
+    parser.add_argument("--replay", metavar="ПУТЬ",
+                        help="прогнать видеофайл или папку кадров без окна и вывести замеры производительности")
+    parser.add_argument("--repeat", type=int, default=1, metavar="N",
+                        help="сколько раз прогнать источник --replay")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.report is not None:
+        print(f"Отчет сохранен: {export_report(LOG_DIR, args.report or None)}")
+    elif args.replay:
+        run_replay(args.replay, max(1, args.repeat))
+    elif len(args.cameras) > 1:
+        run_supervisor(args.cameras, args.headless)
+    else:
+        main(args.cameras[0] if args.cameras else None, args.headless)
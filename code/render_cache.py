@@ -0,0 +1,148 @@
+# render_cache.py - Кэши ресурсов для отрисовки пропусков
+import os
+import threading
+from collections import OrderedDict
+import qrcode
+from PIL import Image, ImageFont, ImageOps
+
+FONT_CACHE_SIZE = 32  # Сколько объектов шрифтов (путь, размер) держать в памяти
+ASSET_CACHE_SIZE = 16  # Сколько подготовленных изображений (фон, значок таймера) держать в памяти
+LAYER_CACHE_SIZE = 128  # Сколько слоев пропуска (текстовые блоки, фото) держать в памяти
+QR_CACHE_SIZE = 64  # Сколько изображений QR-кодов (данные, размер) держать в памяти
+QR_BORDER = 2  # Ширина белой рамки QR-кода в модулях
+TIMER_ICON_SIZE = (100, 100)
+
+
+class LRUCache:
+    """Потокобезопасный кэш с вытеснением давно не использованных записей"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.items:
+                self.misses += 1
+                return default
+            self.items.move_to_end(key)
+            self.hits += 1
+            return self.items[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+font_cache = LRUCache(FONT_CACHE_SIZE)
+asset_cache = LRUCache(ASSET_CACHE_SIZE)
+layer_cache = LRUCache(LAYER_CACHE_SIZE)
+qr_cache = LRUCache(QR_CACHE_SIZE)
+
+
+def file_mtime(path):
+    """Время изменения файла или None, если файла нет (например, системный шрифт по имени)"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def get_font(path, size):
+    """Возвращает FreeTypeFont из кэша; если файл шрифта изменился, он загружается заново"""
+    key = (path, size)
+    mtime = file_mtime(path)
+    cached = font_cache.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    font = ImageFont.truetype(path, size)
+    font_cache.put(key, (mtime, font))
+    return font
+
+
+def prepare_pattern(image, bw):
+    """Подготовка фона пропуска: перевод в оттенки серого для черно-белой печати"""
+    if bw and image.mode != 'L':
+        return ImageOps.grayscale(image)
+    if image.mode not in ('L', 'RGB', 'RGBA'):
+        return image.convert('RGB')  # Слои накладываются цветом, палитровые режимы для этого не подходят
+    return image.copy()
+
+
+def prepare_timer(image, bw):
+    """Подготовка значка временного пропуска: прозрачность на белом фоне, серый, уменьшение"""
+    if image.mode == 'RGBA':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[3])
+        image = background
+
+    if bw and image.mode != 'L':
+        image = ImageOps.grayscale(image)
+    else:
+        image = image.copy()
+
+    image.thumbnail(TIMER_ICON_SIZE)
+    return image
+
+
+def load_cached_image(path, bw, prepare):
+    """Возвращает подготовленное изображение из кэша по ключу (путь, время изменения, ч/б).
+
+    Изображение общее для всех вызовов: изменять можно только его копию.
+    Если файла нет, возбуждается FileNotFoundError.
+    """
+    mtime = file_mtime(path)
+    if mtime is None:
+        raise FileNotFoundError(path)
+    key = (path, mtime, bw)
+    image = asset_cache.get(key)
+    if image is None:
+        with Image.open(path) as source:
+            image = prepare(source, bw)
+        asset_cache.put(key, image)
+    return image
+
+
+def render_qr_image(payload, size):
+    """Возвращает QR-код размером size x size (режим L) из кэша.
+
+    Каждый модуль рисуется целым числом пикселей с масштабированием по
+    ближайшему соседу, остаток до size заполняется белым полем вокруг кода.
+    Изображение общее для всех вызовов: изменять можно только его копию.
+    """
+    key = (payload, size)
+    image = qr_cache.get(key)
+    if image is not None:
+        return image
+
+    qr = qrcode.QRCode(version=1, border=QR_BORDER, error_correction=qrcode.constants.ERROR_CORRECT_L)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+    modules = len(matrix)
+    if modules > size:
+        raise ValueError(f"QR-код из {modules} модулей не помещается в {size} пикселей")
+
+    pixels = bytes(0 if cell else 255 for row in matrix for cell in row)
+    code = Image.frombytes('L', (modules, modules), pixels)
+    module_size = size // modules
+    code = code.resize((modules * module_size, modules * module_size), Image.Resampling.NEAREST)
+
+    image = Image.new('L', (size, size), 255)
+    offset = (size - code.width) // 2
+    image.paste(code, (offset, offset))
+    qr_cache.put(key, image)
+    return image
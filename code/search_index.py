@@ -0,0 +1,153 @@
+# search_index.py - Инвертированный индекс для поиска профилей
+import bisect
+import heapq
+import re
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Вес совпадения по полю: чем выше, тем выше профиль в выдаче
+FIELD_WEIGHTS = {
+    "ID": 8,
+    "full_name": 4,
+    "organization": 2,
+    "department": 1,
+}
+EXACT_TOKEN_BONUS = 2  # Множитель за полное совпадение слова, а не только префикса
+
+
+def normalize(text):
+    """Приводит текст к виду для поиска (регистр, ё → е)"""
+    return str(text).casefold().replace('ё', 'е')
+
+
+def tokenize(text):
+    """Разбивает текст на слова для индекса"""
+    return TOKEN_PATTERN.findall(normalize(text))
+
+
+class ProfileSearchIndex:
+    """Индекс по префиксам слов из полей ID, full_name, organization и department.
+
+    Словарь слов хранится отсортированным, поэтому все слова с заданным
+    префиксом находятся двоичным поиском. Для каждого слова хранится
+    отображение ID → вес лучшего поля, в котором оно встретилось.
+    """
+
+    def __init__(self):
+        self.postings = {}  # слово -> {ID: вес}
+        self.vocabulary = []  # отсортированный список слов
+        self.doc_tokens = {}  # ID -> набор слов профиля
+        self.doc_order = {}  # ID -> порядковый номер добавления
+        self.order_counter = 0
+
+    def __len__(self):
+        return len(self.doc_tokens)
+
+    def add(self, record):
+        """Добавляет или переиндексирует профиль"""
+        self._index(record, update_vocabulary=True)
+
+    def add_many(self, records):
+        """Добавляет пачку профилей: словарь слов сортируется один раз в конце, а не на каждое новое слово"""
+        for record in records:
+            self._index(record, update_vocabulary=False)
+        self.vocabulary = sorted(self.postings)
+
+    def _index(self, record, update_vocabulary):
+        """Индексирует профиль; без update_vocabulary отсортированный словарь не поддерживается"""
+        user_id = record.get('ID')
+        if not user_id:
+            return
+        if user_id in self.doc_tokens:
+            self._remove_tokens(user_id, update_vocabulary)
+        else:
+            self.doc_order[user_id] = self.order_counter
+            self.order_counter += 1
+
+        weights = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            value = record.get(field)
+            if not value:
+                continue
+            for token in tokenize(value):
+                if weights.get(token, 0) < weight:
+                    weights[token] = weight
+
+        for token, weight in weights.items():
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = {}
+                if update_vocabulary:
+                    bisect.insort(self.vocabulary, token)
+            posting[user_id] = weight
+        self.doc_tokens[user_id] = set(weights)
+
+    def remove(self, user_id):
+        """Удаляет профиль из индекса"""
+        if user_id not in self.doc_tokens:
+            return
+        self._remove_tokens(user_id)
+        del self.doc_tokens[user_id]
+        del self.doc_order[user_id]
+
+    def _remove_tokens(self, user_id, update_vocabulary=True):
+        """Удаляет ID из списков всех слов профиля"""
+        for token in self.doc_tokens[user_id]:
+            posting = self.postings[token]
+            posting.pop(user_id, None)
+            if not posting:
+                del self.postings[token]
+                if not update_vocabulary:
+                    continue
+                position = bisect.bisect_left(self.vocabulary, token)
+                del self.vocabulary[position]
+
+    def _match_prefix(self, prefix):
+        """Возвращает {ID: оценка} для всех слов, начинающихся с префикса"""
+        matches = {}
+        position = bisect.bisect_left(self.vocabulary, prefix)
+        while position < len(self.vocabulary):
+            token = self.vocabulary[position]
+            if not token.startswith(prefix):
+                break
+            bonus = EXACT_TOKEN_BONUS if token == prefix else 1
+            for user_id, weight in self.postings[token].items():
+                score = weight * bonus
+                if matches.get(user_id, 0) < score:
+                    matches[user_id] = score
+            position += 1
+        return matches
+
+    def search(self, query, offset=0, limit=None):
+        """Ищет профили, где каждое слово запроса является префиксом слова профиля.
+
+        Возвращает кортеж (список ID текущей страницы по убыванию релевантности,
+        общее число найденных профилей).
+        """
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            ids = sorted(self.doc_order, key=self.doc_order.get)
+            total = len(ids)
+            end = None if limit is None else offset + limit
+            return ids[offset:end], total
+
+        scores = None
+        # Сначала самые длинные слова запроса: они дают самые короткие списки
+        for token in sorted(set(query_tokens), key=len, reverse=True):
+            matches = self._match_prefix(token)
+            if scores is None:
+                scores = matches
+            else:
+                scores = {user_id: score + matches[user_id]
+                          for user_id, score in scores.items() if user_id in matches}
+            if not scores:
+                return [], 0
+
+        total = len(scores)
+        rank = lambda user_id: (-scores[user_id], self.doc_order[user_id])
+        if limit is None:
+            ranked = sorted(scores, key=rank)
+            return ranked[offset:], total
+
+        ranked = heapq.nsmallest(offset + limit, scores, key=rank)
+        return ranked[offset:], total
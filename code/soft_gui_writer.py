@@ -817,20 +817,14 @@ class UserProfileApp:
                     preview_data["expiration_date"] = expiration_storage
             
             # Создаем изображение для предпросмотра
+            # Фото (если указано) накладывается при той же отрисовке
             preview_image = self.profile_manager.preview_profile_image(
                 preview_data, 
-                convert_pattern_to_bw=self.convert_pattern_to_bw.get()
+                convert_pattern_to_bw=self.convert_pattern_to_bw.get(),
+                photo_path=self.photo_path.get(),
+                convert_photo_to_bw=self.convert_photo_to_bw.get()
             )
             
-            # Добавляем фото если указано
-            if self.photo_path.get() and os.path.exists(self.photo_path.get()):
-                preview_image = self.profile_manager.add_user_photo_to_image(
-                    preview_image, 
-                    self.photo_path.get(),
-                    convert_photo_to_bw=self.convert_photo_to_bw.get(),
-                    convert_pattern_to_bw=self.convert_pattern_to_bw.get()
-                )
-            
             # Получаем размеры области предпросмотра
             canvas_width = self.preview_canvas.winfo_width()
             canvas_height = self.preview_canvas.winfo_height()
@@ -969,5 +963,10 @@ if __name__ == "__main__":
     root = tk.Tk()
     style = ttk.Style()
     style.configure('Accent.TButton', font=('Arial', 10, 'bold'))
-    app = UserProfileApp(root)
-    root.mainloop()
+    try:
+        app = UserProfileApp(root)
+    except RuntimeError as e:
+        messagebox.showerror("Ошибка", str(e))
+        root.destroy()
+    else:
+        root.mainloop()
@@ -0,0 +1,101 @@
+# test_profile_store.py - Проверки журнала профилей data_user.md
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "code"))
+
+from profile_store import ProfileStore, serialize_record
+
+
+def make_profile(user_id, name="Иванов Иван"):
+    return {"ID": user_id, "full_name": name, "organization": "ООО", "department": "ИТ"}
+
+
+class ProfileStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_file = os.path.join(self.temp_dir.name, "data_user.md")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_compaction_keeps_blocks_of_other_writers(self):
+        first = ProfileStore(self.data_file, compact_min_dead=1, compact_ratio=0)
+        first.load()
+        first.put(make_profile("UI000001"))
+
+        second = ProfileStore(self.data_file)
+        second.load()
+        second.put_many([make_profile(f"UI00010{i}") for i in range(5)])
+
+        # Повторная запись создает устаревший блок и запускает сжатие в первом хранилище
+        first.put(make_profile("UI000001", "Петров Петр"))
+        first.wait_for_compaction()
+
+        records = {record["ID"]: record for record in ProfileStore(self.data_file).load()}
+        self.assertEqual(sorted(records), ["UI000001"] + [f"UI00010{i}" for i in range(5)])
+        self.assertEqual(records["UI000001"]["full_name"], "Петров Петр")
+        self.assertEqual(first.read("UI000001")["full_name"], "Петров Петр")
+        self.assertEqual(first.dead_blocks(), 0)
+
+    def test_load_waits_for_block_being_appended(self):
+        store = ProfileStore(self.data_file)
+        store.put(make_profile("UI000001"))
+        temporary = dict(make_profile("UI000002"), expiration_date="2030-01-01", is_temporary=True)
+        block = serialize_record(temporary).encode("utf-8")
+        cut = block.index(b"expiration_date")
+
+        reader = ProfileStore(self.data_file)
+        loaded = []
+        with store.file_lock:
+            with open(self.data_file, "ab") as f:
+                f.write(block[:cut])  # Дозапись идет под блокировкой, как в _append_blocks
+                f.flush()
+                thread = threading.Thread(target=lambda: loaded.extend(reader.load()))
+                thread.start()
+                time.sleep(0.1)
+                self.assertTrue(thread.is_alive())
+                f.write(block[cut:])
+        thread.join()
+        self.assertEqual(loaded[1]["expiration_date"], "2030-01-01")
+
+    def test_load_keeps_last_block_without_blank_line(self):
+        with open(self.data_file, "w", encoding="utf-8", newline="") as f:
+            f.write("---\r\nID: UI000001\r\n\r\n---\r\nID: UI000002\r\nis_temporary: True\r\n")
+        self.assertEqual([record["ID"] for record in ProfileStore(self.data_file).load()], ["UI000001", "UI000002"])
+
+    def test_read_changes_reloads_after_in_place_edit(self):
+        writer = ProfileStore(self.data_file)
+        writer.put(make_profile("UI000001", "Иванов Иван"))
+        writer.put(make_profile("UI000002"))
+        reader = ProfileStore(self.data_file)
+        reader.load()
+        cursor = reader.read_cursor
+
+        writer.put(make_profile("UI000003"))
+        changes, cursor = reader.read_changes(cursor)
+        self.assertEqual([user_id for user_id, _ in changes], ["UI000003"])
+
+        # Правка на месте без изменения размера файла
+        with open(self.data_file, "rb") as f:
+            raw = f.read()
+        with open(self.data_file, "wb") as f:
+            f.write(raw.replace("Иванов Иван".encode("utf-8"), "Петров Петр".encode("utf-8"), 1))
+        self.assertIsNone(reader.read_changes(cursor))
+
+        # Правка в середине файла, после которой файл стал длиннее
+        reader.load()
+        cursor = reader.read_cursor
+        with open(self.data_file, "rb") as f:
+            raw = f.read()
+        with open(self.data_file, "wb") as f:
+            f.write(raw.replace("Петров Петр".encode("utf-8"), "Петров Петр Петрович".encode("utf-8"), 1))
+        self.assertIsNone(reader.read_changes(cursor))
+
+if __name__ == "__main__":
+    unittest.main()
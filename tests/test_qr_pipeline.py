@@ -0,0 +1,49 @@
+# test_qr_pipeline.py - Проверки распознавания QR-кодов
+import os
+import sys
+import unittest
+
+import cv2
+import numpy
+import qrcode
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "code"))
+
+from qr_pipeline import QRDecodeStage, decode_qr_two_stage
+
+
+def make_frame(data, box_size, size=(720, 1280)):
+    """Серый кадр с QR-кодом из модулей box_size пикселей"""
+    qr = qrcode.QRCode(box_size=box_size, border=2)
+    qr.add_data(data)
+    qr.make(fit=True)
+    code = numpy.array(qr.make_image().convert("L"))
+    frame = numpy.full(size, 200, numpy.uint8)
+    height, width = code.shape
+    frame[300:300 + height, 600:600 + width] = code
+    return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+
+
+class TwoStageDecodeTest(unittest.TestCase):
+
+    def test_small_code_decoded_by_full_frame_fallback(self):
+        detector = cv2.QRCodeDetector()
+        frame = make_frame("ABCDEFGH", box_size=2)  # Код 50x50 пикселей не находится на уменьшенном кадре
+        self.assertIsNone(decode_qr_two_stage(frame, detector)[0])
+        self.assertEqual(decode_qr_two_stage(frame, detector, full_fallback=True)[0], "ABCDEFGH")
+
+    def test_decode_stage_uses_fallback_for_moving_frames(self):
+        frame = make_frame("ABCDEFGH", box_size=2)
+        results = {}
+        stage = QRDecodeStage(workers=1, on_result=lambda frame_id, data, points: results.update({frame_id: data}))
+        try:
+            stage.submit(1, frame, wait=True, moving=True)
+            stage.submit(2, frame, wait=True, moving=False)
+            stage.wait_idle()
+        finally:
+            stage.stop()
+        self.assertEqual(results, {1: "ABCDEFGH", 2: None})
+
+
+if __name__ == "__main__":
+    unittest.main()
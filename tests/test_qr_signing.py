@@ -0,0 +1,37 @@
+# test_qr_signing.py - Проверки подписанных данных QR-кода
+import datetime
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "code"))
+
+from qr_signing import sign_payload, verify_payload
+
+KEY = bytes(range(32))
+
+
+class SignedPayloadTest(unittest.TestCase):
+
+    def test_legacy_expiry_date_round_trip(self):
+        # Запись 1YVCIEKY в database/data_user.md хранит срок в формате ДД.ММ.ГГГГ
+        payload = sign_payload(KEY, "1YVCIEKY", "28.11.2077", True)
+        self.assertTrue(payload.startswith("U1.1YVCIEKY.20771128.1."))
+        self.assertEqual(verify_payload(KEY, payload),
+                         {'ID': "1YVCIEKY", 'expiration_date': datetime.date(2077, 11, 28), 'is_temporary': True})
+
+    def test_storage_date_and_no_expiry(self):
+        self.assertEqual(verify_payload(KEY, sign_payload(KEY, "2AGA83V4", "2025-12-12"))['expiration_date'],
+                         datetime.date(2025, 12, 12))
+        self.assertIsNone(verify_payload(KEY, sign_payload(KEY, "2AGA83V4"))['expiration_date'])
+
+    def test_free_text_expiry_rejected(self):
+        with self.assertRaises(ValueError):
+            sign_payload(KEY, "2AGA83V4", "до конца года")
+
+    def test_malformed_payload_rejected(self):
+        self.assertIsNone(verify_payload(KEY, "U1.ABCDEFGH.-.0.ж"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -390,11 +390,28 @@ async function deleteTemplate(templateName) {
 
 // ==================== АДМИНИСТРИРОВАНИЕ ====================
 
+// Параметры виртуализированной таблицы профилей
+const PROFILES_PAGE_SIZE = 100;  // Строк в одном запросе к Python
+const PROFILE_ROW_HEIGHT = 49;  // Фиксированная высота строки таблицы в пикселях
+const PROFILE_ROWS_BUFFER = 10;  // Дополнительные строки выше и ниже видимой области
+
+// Состояние таблицы: текущий запрос, общее число строк и загруженные страницы
+let profilesView = createProfilesView('');
+let profilesRenderScheduled = false;
+
+function createProfilesView(searchTerm) {
+    return {
+        searchTerm: searchTerm,
+        total: 0,
+        pages: new Map(),
+        loading: new Set()
+    };
+}
+
 // Функция для поиска профилей
 async function searchProfiles() {
     const searchTerm = document.getElementById('search-profiles').value;
-    const profiles = await eel.search_profiles(searchTerm)();
-    displayProfiles(profiles);
+    await loadProfilesView(searchTerm);
 }
 
 // Функция для очистки поиска
@@ -405,17 +422,61 @@ async function clearSearch() {
 
 // Функция для загрузки всех профилей
 async function loadAllProfiles() {
-    const profiles = await eel.search_profiles('')();
-    displayProfiles(profiles);
+    const searchTerm = document.getElementById('search-profiles').value;
+    await loadProfilesView(searchTerm);
     updateProfilesCount();
 }
 
-// Функция для отображения профилей в таблице
-function displayProfiles(profiles) {
+// Функция для сброса таблицы и загрузки первой страницы
+async function loadProfilesView(searchTerm) {
+    profilesView = createProfilesView(searchTerm);
+    document.getElementById('profiles-scroll').scrollTop = 0;
+    await fetchProfilesPage(0);
+}
+
+// Функция для загрузки страницы профилей по номеру
+async function fetchProfilesPage(pageIndex) {
+    const view = profilesView;
+    if (view.pages.has(pageIndex) || view.loading.has(pageIndex)) {
+        return;
+    }
+
+    view.loading.add(pageIndex);
+    try {
+        const page = await eel.list_profiles(view.searchTerm, pageIndex * PROFILES_PAGE_SIZE, PROFILES_PAGE_SIZE)();
+        view.total = page.total;
+        view.pages.set(pageIndex, page.profiles);
+    } catch (error) {
+        console.error('Ошибка загрузки профилей:', error);
+    } finally {
+        view.loading.delete(pageIndex);
+    }
+
+    // Ответ на устаревший запрос не отображаем
+    if (view === profilesView) {
+        renderVisibleProfiles();
+    }
+}
+
+// Функция для планирования перерисовки при прокрутке
+function scheduleProfilesRender() {
+    if (profilesRenderScheduled) {
+        return;
+    }
+    profilesRenderScheduled = true;
+    requestAnimationFrame(() => {
+        profilesRenderScheduled = false;
+        renderVisibleProfiles();
+    });
+}
+
+// Функция для отображения только видимых строк таблицы
+function renderVisibleProfiles() {
+    const container = document.getElementById('profiles-scroll');
     const tbody = document.getElementById('profiles-tbody');
-    tbody.innerHTML = '';
+    const total = profilesView.total;
 
-    if (profiles.length === 0) {
+    if (total === 0) {
         tbody.innerHTML = `
             <tr>
                 <td colspan="7" class="text-center text-muted">
@@ -426,44 +487,90 @@ function displayProfiles(profiles) {
         return;
     }
 
-    profiles.forEach(profile => {
-        const row = document.createElement('tr');
-        
-        const createdDate = formatDisplayDate(profile.created_at);
-        const expirationDate = profile.expiration_date ? 
-            formatDisplayDate(profile.expiration_date) : 'Бессрочный';
-
-        row.innerHTML = `
-            <td>
-                <span class="badge bg-secondary">${profile.ID}</span>
-                ${profile.is_temporary ? '<i class="fas fa-clock text-warning ms-1" title="Временный профиль"></i>' : ''}
-            </td>
-            <td>${profile.full_name}</td>
-            <td>${profile.organization || '-'}</td>
-            <td>${profile.department || '-'}</td>
-            <td>${createdDate}</td>
-            <td>
-                ${profile.expiration_date ? 
-                    `<span class="${isDateExpired(profile.expiration_date) ? 'text-danger' : 'text-success'}">${expirationDate}</span>` : 
-                    '<span class="text-success">Бессрочный</span>'
-                }
-            </td>
-            <td>
-                <div class="btn-group btn-group-sm" role="group">
-                    <button type="button" class="btn btn-outline-primary" onclick="editProfile('${profile.ID}')" title="Редактировать">
-                        <i class="fas fa-edit"></i>
-                    </button>
-                    <button type="button" class="btn btn-outline-warning" onclick="openRecoverModal('${profile.ID}')" title="Восстановить">
-                        <i class="fas fa-redo"></i>
-                    </button>
-                    <button type="button" class="btn btn-outline-danger" onclick="showDeleteModal('${profile.ID}', '${profile.full_name}')" title="Удалить">
-                        <i class="fas fa-trash"></i>
-                    </button>
-                </div>
-            </td>
-        `;
-        tbody.appendChild(row);
-    });
+    // Начинаем с четной строки, чтобы чередование цветов не менялось при прокрутке
+    let first = Math.max(0, Math.floor(container.scrollTop / PROFILE_ROW_HEIGHT) - PROFILE_ROWS_BUFFER);
+    first -= first % 2;
+    const visibleCount = Math.ceil(container.clientHeight / PROFILE_ROW_HEIGHT) + 2 * PROFILE_ROWS_BUFFER;
+    const last = Math.min(total, first + visibleCount);
+
+    const fragment = document.createDocumentFragment();
+    fragment.appendChild(createSpacerRow(first * PROFILE_ROW_HEIGHT));
+
+    for (let index = first; index < last; index++) {
+        const pageIndex = Math.floor(index / PROFILES_PAGE_SIZE);
+        const page = profilesView.pages.get(pageIndex);
+        if (!page) {
+            fetchProfilesPage(pageIndex);
+            fragment.appendChild(createPlaceholderRow());
+            continue;
+        }
+        const profile = page[index % PROFILES_PAGE_SIZE];
+        fragment.appendChild(profile ? createProfileRow(profile) : createPlaceholderRow());
+    }
+
+    fragment.appendChild(createSpacerRow((total - last) * PROFILE_ROW_HEIGHT));
+    tbody.replaceChildren(fragment);
+}
+
+// Функция для создания пустой строки-заполнителя заданной высоты
+function createSpacerRow(height) {
+    const row = document.createElement('tr');
+    row.className = 'profiles-spacer';
+    row.style.height = `${height}px`;
+    return row;
+}
+
+// Функция для создания строки, пока страница загружается
+function createPlaceholderRow() {
+    const row = document.createElement('tr');
+    row.className = 'profile-row';
+    row.innerHTML = `
+        <td colspan="7" class="text-center text-muted">
+            <i class="fas fa-spinner fa-spin"></i> Загрузка...
+        </td>
+    `;
+    return row;
+}
+
+// Функция для создания строки таблицы профиля
+function createProfileRow(profile) {
+    const row = document.createElement('tr');
+    row.className = 'profile-row';
+
+    const createdDate = formatDisplayDate(profile.created_at);
+    const expirationDate = profile.expiration_date ? 
+        formatDisplayDate(profile.expiration_date) : 'Бессрочный';
+
+    row.innerHTML = `
+        <td>
+            <span class="badge bg-secondary">${profile.ID}</span>
+            ${profile.is_temporary ? '<i class="fas fa-clock text-warning ms-1" title="Временный профиль"></i>' : ''}
+        </td>
+        <td>${profile.full_name}</td>
+        <td>${profile.organization || '-'}</td>
+        <td>${profile.department || '-'}</td>
+        <td>${createdDate}</td>
+        <td>
+            ${profile.expiration_date ? 
+                `<span class="${isDateExpired(profile.expiration_date) ? 'text-danger' : 'text-success'}">${expirationDate}</span>` : 
+                '<span class="text-success">Бессрочный</span>'
+            }
+        </td>
+        <td>
+            <div class="btn-group btn-group-sm" role="group">
+                <button type="button" class="btn btn-outline-primary" onclick="editProfile('${profile.ID}')" title="Редактировать">
+                    <i class="fas fa-edit"></i>
+                </button>
+                <button type="button" class="btn btn-outline-warning" onclick="openRecoverModal('${profile.ID}')" title="Восстановить">
+                    <i class="fas fa-redo"></i>
+                </button>
+                <button type="button" class="btn btn-outline-danger" onclick="showDeleteModal('${profile.ID}', '${profile.full_name}')" title="Удалить">
+                    <i class="fas fa-trash"></i>
+                </button>
+            </div>
+        </td>
+    `;
+    return row;
 }
 
 // Функция для открытия модального окна редактирования
@@ -744,6 +851,9 @@ async function deleteProfile(userId) {
     }
 }
 
+// Подгрузка строк таблицы профилей при прокрутке
+document.getElementById('profiles-scroll').addEventListener('scroll', scheduleProfilesRender);
+
 // Загрузка профилей при открытии вкладки администрирования
 document.getElementById('admin-tab').addEventListener('click', function() {
     loadAllProfiles();